@@ -20,8 +20,79 @@ class Settings(BaseSettings):
     secret_key: str
     algorithm: str
     access_token_expire_seconds: int
+    # SQLAlchemy connection pool
+    database_pool_size: int = 10
+    database_max_overflow: int = 20
+    database_pool_timeout: int = 30
+    database_pool_recycle: int = 1800
+    database_pool_pre_ping: bool = True
+    # Read replicas: comma-separated host[:port], balanced "round_robin" or "least_connections".
+    # Replicas lagging more than max_lag seconds leave the rotation, users read from
+    # the primary for read_your_writes_window seconds after they write
+    database_replica_hosts: str = ""
+    database_replica_balancing: str = "round_robin"
+    database_replica_max_lag: float = 5.0
+    database_replica_check_interval: float = 5.0
+    database_read_your_writes_window: float = 5.0
+    # posts_2 monthly partitions are created this many months ahead, checked every interval seconds
+    posts_partition_months_ahead: int = 3
+    posts_partition_check_interval: float = 6 * 3600
+    # Worker id embedded in post ids (0-1023), unique per running process; -1 claims one from Redis on startup
+    post_id_worker: int = -1
     kafka_port: str
     kafka_posts_topic: str
+    kafka_likes_topic: str = "likes"
+    # Posts that can't be ingested are parked here
+    kafka_posts_dlq_topic: str = "posts-dlq"
+    kafka_likes_dlq_topic: str = "likes-dlq"
+    # Kafka producer batching
+    kafka_producer_linger_ms: int = 10
+    kafka_producer_batch_size: int = 65536
+    kafka_producer_compression: str = "lz4"
+    kafka_producer_acks: str = "all"
+    kafka_producer_idempotence: bool = True
+    kafka_producer_flush_timeout: float = 10.0
+    # Kafka consumer batching: flush on batch size or max latency (seconds)
+    kafka_consumer_batch_size: int = 500
+    kafka_consumer_max_latency: float = 1.0
+    # /metrics of the consumer process
+    kafka_consumer_metrics_port: int = 9101
+    # Redis connection pool
+    redis_hostname: str = "localhost"
+    redis_port: int = 6379
+    redis_db: int = 0
+    redis_max_connections: int = 50
+    redis_health_check_interval: int = 30
+    # post:* cache: "zset" evicts least recently used posts past redis_cache_max_size,
+    # "native" leaves eviction to Redis maxmemory-policy
+    redis_cache_eviction: str = "zset"
+    redis_cache_max_size: int = 10000
+    redis_cache_ttl: int = 3600
+    # Per-worker L1 in front of post:* keys
+    post_l1_max_size: int = 1000
+    post_l1_ttl: float = 5.0
+    # Stampede protection: TTL jitter (fraction), fill lease, XFetch early refresh (delta in seconds)
+    redis_cache_ttl_jitter: float = 0.1
+    redis_cache_fill_lock_ms: int = 2000
+    redis_cache_early_refresh_delta: float = 1.0
+    redis_cache_early_refresh_beta: float = 1.0
+    redis_maxmemory: str = ""
+    redis_maxmemory_policy: str = "volatile-lru"
+    # Home feeds: capped per-user timelines, accounts above the follower limit are merged in on read
+    feed_max_length: int = 800
+    feed_fanout_max_followers: int = 10000
+    # Authenticated user principals: per-worker TTL cache, optionally shared through Redis
+    user_cache_max_size: int = 10000
+    user_cache_ttl: int = 60
+    user_cache_redis: bool = True
+    user_cache_redis_ttl: int = 300
+    # bcrypt work factor and the worker pool/admission budget for hashing and verification
+    password_hash_rounds: int = 12
+    password_hash_workers: int = 4
+    password_hash_max_concurrency: int = 32
+    password_hash_queue_timeout: float = 2.0
+    # Serialize post responses with orjson, skipping response_model re-validation
+    fast_json_responses: bool = False
     class Config:
         env_file = '.env'
 settings = Settings()
@@ -1,8 +1,13 @@
+import asyncio
+import itertools
 import os
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from .config import settings
+from .metrics import instrument_engine, Gauge
 
 # Get the parent directory
 parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
@@ -13,17 +18,106 @@ load_dotenv(dotenv_path)
 
 # Import SQLALCHEMY path
 SQLALCHEMY_DATABASE_URL = f'postgresql://{settings.database_username}:{settings.database_password}@{settings.database_hostname}:{settings.database_port}/{settings.database_name}'
+ASYNC_SQLALCHEMY_DATABASE_URL = f'postgresql+asyncpg://{settings.database_username}:{settings.database_password}@{settings.database_hostname}:{settings.database_port}/{settings.database_name}'
 # print(SQLALCHEMY_DATABASE_URL)
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+
+# Pool tuning shared by the sync and async engines
+POOL_OPTIONS = dict(
+    pool_size=settings.database_pool_size,
+    max_overflow=settings.database_max_overflow,
+    pool_timeout=settings.database_pool_timeout,
+    pool_recycle=settings.database_pool_recycle,
+    pool_pre_ping=settings.database_pool_pre_ping,
+)
+
+# Sync engine: used by the Kafka consumer process
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **POOL_OPTIONS)
+
+instrument_engine(engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush = False, bind = engine)
 
+# Async engine: used by the FastAPI routers
+async_engine = create_async_engine(ASYNC_SQLALCHEMY_DATABASE_URL, **POOL_OPTIONS)
+instrument_engine(async_engine.sync_engine)
+
+AsyncSessionLocal = async_sessionmaker(bind = async_engine, autoflush = False, expire_on_commit = False)
+
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
+# Primary: every write, and reads that must see them
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
+# Read replicas: DATABASE_REPLICA_HOSTS="host1:5432,host2" (same database and credentials as the primary)
+def replica_urls():
+    for address in filter(None, (part.strip() for part in settings.database_replica_hosts.split(","))):
+        host, _, port = address.partition(":")
+        yield f'postgresql+asyncpg://{settings.database_username}:{settings.database_password}@{host}:{port or settings.database_port}/{settings.database_name}'
+
+replica_lag = Gauge("db_replica_lag_seconds", "Replication lag of each read replica", ("replica",))
+replica_healthy = Gauge("db_replica_healthy", "1 if the replica is in the read rotation", ("replica",))
+
+# 0 when the replica replayed everything it received, else the age of the last replayed transaction
+REPLICA_LAG_QUERY = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END")
+
+class ReplicaSet:
+    def __init__(self, engines):
+        self.engines = engines
+        # Replicas start out of rotation until their first lag check
+        self.healthy = []
+        self.counter = itertools.count()
+
+    # Engine for the next read, None if no replica is usable
+    def pick(self):
+        healthy = self.healthy
+        if not healthy:
+            return None
+        if settings.database_replica_balancing == "least_connections":
+            return min(healthy, key=lambda engine: engine.pool.checkedout())
+        return healthy[next(self.counter) % len(healthy)]
+
+    async def replica_lag(self, engine):
+        try:
+            async with engine.connect() as conn:
+                lag = (await conn.execute(REPLICA_LAG_QUERY)).scalar()
+                return float(lag) if lag is not None else 0.0
+        except Exception as e:
+            print(f"Replica {engine.url.host} check failed: {e}")
+            return None
+
+    async def check(self):
+        lags = await asyncio.gather(*[self.replica_lag(engine) for engine in self.engines])
+        healthy = []
+        for engine, lag in zip(self.engines, lags):
+            ok = lag is not None and lag <= settings.database_replica_max_lag
+            replica_lag.set(lag if lag is not None else -1, replica=engine.url.host)
+            replica_healthy.set(int(ok), replica=engine.url.host)
+            if ok:
+                healthy.append(engine)
+        self.healthy = healthy
+
+    # Background task: drop lagging or unreachable replicas from rotation and bring them back when they catch up
+    async def monitor(self):
+        while True:
+            await self.check()
+            await asyncio.sleep(settings.database_replica_check_interval)
+
+    async def dispose(self):
+        for engine in self.engines:
+            await engine.dispose()
+
+replica_engines = [create_async_engine(url, **POOL_OPTIONS) for url in replica_urls()]
+for replica_engine in replica_engines:
+    instrument_engine(replica_engine.sync_engine)
+replicas = ReplicaSet(replica_engines)
+
+# Session on a replica, or on the primary when asked to or no replica is usable
+@asynccontextmanager
+async def read_session(primary: bool = False):
+    engine = None if primary else replicas.pick()
+    async with AsyncSessionLocal(bind=engine or async_engine) as db:
+        yield db
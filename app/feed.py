@@ -0,0 +1,190 @@
+import time
+from datetime import datetime, timezone
+import redis.asyncio as redis
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import models
+from .config import settings
+from .redis_cache import build_post_out, save_posts_to_redis, first_json_match
+from .metrics import record_cache
+
+# Home feeds
+# feed:{user_id}      sorted set of post ids scored by createdAt, capped at feed_max_length
+# following:{user_id} set of followee ids, the sentinel marks the set as loaded from the DB
+# feed:celebrities    accounts with more than feed_fanout_max_followers followers,
+#                     their posts are merged into feeds on read instead of fanned out
+CELEBRITIES_KEY = "feed:celebrities"
+FOLLOWING_SENTINEL = "*"
+FOLLOWING_TTL = 86400
+
+def feed_key(user_id):
+    return f"feed:{user_id}"
+
+def following_key(user_id):
+    return f"following:{user_id}"
+
+# Seconds a feed score may differ from the post's stored createdAt
+SCORE_SLACK = 24 * 3600
+
+def post_timestamp(created_at):
+    return created_at.timestamp() if created_at else time.time()
+
+# Queue adding a post to the given feeds, trimming each feed to its cap
+def queue_feed_push(pipe, user_ids, post_id, score):
+    for user_id in user_ids:
+        key = feed_key(user_id)
+        pipe.zadd(key, {post_id: score})
+        pipe.zremrangebyrank(key, 0, -settings.feed_max_length - 1)
+
+# Fan-out-on-write for a batch of persisted posts, called by the posts consumer
+async def fan_out_posts(r: redis.Redis, db: Session, rows):
+    owner_ids = {row["owner_id"] for row in rows}
+    follower_counts = dict(db.execute(
+        select(models.Follow.followee_id, func.count())
+        .where(models.Follow.followee_id.in_(owner_ids))
+        .group_by(models.Follow.followee_id)).all())
+    celebrities = {owner_id for owner_id, count in follower_counts.items()
+                   if count > settings.feed_fanout_max_followers}
+    regular = owner_ids - celebrities
+
+    # Authors always see their own posts
+    followers = {owner_id: [owner_id] for owner_id in owner_ids}
+    if regular:
+        edges = db.execute(select(models.Follow.followee_id, models.Follow.follower_id)
+                           .where(models.Follow.followee_id.in_(regular)))
+        for followee_id, follower_id in edges:
+            followers[followee_id].append(follower_id)
+
+    async with r.pipeline(transaction=False) as pipe:
+        if celebrities:
+            pipe.sadd(CELEBRITIES_KEY, *celebrities)
+        if regular:
+            pipe.srem(CELEBRITIES_KEY, *regular)
+        for row in rows:
+            targets = [row["owner_id"]] if row["owner_id"] in celebrities else followers[row["owner_id"]]
+            queue_feed_push(pipe, targets, row["id"], post_timestamp(row.get("createdAt")))
+        await pipe.execute()
+
+# Make sure the user's following set is in Redis, loading it from the DB on a cold cache
+async def load_following(r: redis.Redis, db: AsyncSession, user_id):
+    key = following_key(user_id)
+    cached = await r.exists(key)
+    record_cache("following", cached)
+    if cached:
+        return
+    followee_ids = (await db.execute(select(models.Follow.followee_id)
+                                     .where(models.Follow.follower_id == user_id))).scalars().all()
+    async with r.pipeline(transaction=True) as pipe:
+        pipe.sadd(key, FOLLOWING_SENTINEL, *followee_ids)
+        pipe.expire(key, FOLLOWING_TTL)
+        await pipe.execute()
+
+async def add_following(r: redis.Redis, db: AsyncSession, user_id, followee_id):
+    # Only touch a loaded set, a cold one is rebuilt from the DB on the next read
+    if await r.exists(following_key(user_id)):
+        await r.sadd(following_key(user_id), followee_id)
+
+    if await r.sismember(CELEBRITIES_KEY, followee_id):
+        return
+    # Backfill the followee's recent posts into the new follower's feed
+    recent = (await db.execute(select(models.Post.id, models.Post.createdAt)
+                               .where(models.Post.owner_id == followee_id)
+                               .order_by(models.Post.createdAt.desc())
+                               .limit(settings.feed_max_length))).all()
+    async with r.pipeline(transaction=False) as pipe:
+        for post_id, created_at in recent:
+            queue_feed_push(pipe, [user_id], post_id, post_timestamp(created_at))
+        await pipe.execute()
+
+async def remove_following(r: redis.Redis, db: AsyncSession, user_id, followee_id):
+    await r.srem(following_key(user_id), followee_id)
+
+    # Take the followee's posts out of the feed, so pages aren't left short of them.
+    # The feed holds at most feed_max_length posts, the followee's can't be older than that many of theirs
+    post_ids = (await db.execute(select(models.Post.id)
+                                 .where(models.Post.owner_id == followee_id)
+                                 .order_by(models.Post.createdAt.desc())
+                                 .limit(settings.feed_max_length))).scalars().all()
+    if post_ids:
+        await r.zrem(feed_key(user_id), *post_ids)
+
+# Posts of a slice of the feed, {post_id: post}, and whether they all came from Redis.
+# Posts deleted since they were fanned out are left out
+async def load_feed_posts(r: redis.Redis, db: AsyncSession, scores):
+    # One multi-get for every post in the slice
+    posts = {}
+    docs = await r.json().mget([f"post:{post_id}" for post_id in scores], "$")
+    for post_id, doc in zip(scores, docs):
+        doc = first_json_match(doc)
+        if doc:
+            posts[post_id] = doc
+
+    missing = [post_id for post_id in scores if post_id not in posts]
+    record_cache("post", True, count=len(posts))
+    record_cache("post", False, count=len(missing))
+    if missing:
+        # Feed scores are creation times, bounding createdAt prunes posts_2 to the month partitions of this page.
+        # A day of slack covers scores taken from the producer's clock
+        missing_scores = [scores[post_id] for post_id in missing]
+        rows = (await db.execute(select(models.Post)
+                                 .where(models.Post.id.in_(missing))
+                                 .where(models.Post.createdAt.between(
+                                     datetime.fromtimestamp(min(missing_scores) - SCORE_SLACK, timezone.utc),
+                                     datetime.fromtimestamp(max(missing_scores) + SCORE_SLACK, timezone.utc)))
+                                 )).scalars().all()
+        outs = [build_post_out(post, post.like_count) for post in rows]
+        await save_posts_to_redis(r, outs)
+        for post_out in outs:
+            posts[post_out.id] = post_out.model_dump()
+    return posts, not missing
+
+# Read a page of the home feed, newest first, older than the `before` timestamp.
+# Returns up to limit + 1 (score, post) pairs and whether everything came from Redis.
+async def read_feed(r: redis.Redis, db: AsyncSession, user_id, limit: int, before: float | None = None):
+    await load_following(r, db, user_id)
+    key = feed_key(user_id)
+    max_score = f"({before}" if before is not None else "+inf"
+
+    async with r.pipeline(transaction=False) as pipe:
+        pipe.zrevrangebyscore(key, max_score, "-inf", start=0, num=limit + 1, withscores=True)
+        pipe.smembers(following_key(user_id))
+        pipe.sinter(following_key(user_id), CELEBRITIES_KEY)
+        entries, following, celebrities = await pipe.execute()
+
+    authors = {int(member) for member in following if member != FOLLOWING_SENTINEL} | {user_id}
+    celebrities = [int(member) for member in celebrities]
+
+    # Deleted posts and posts of accounts the user unfollowed since they were fanned out drop out of a slice,
+    # read further slices until limit + 1 posts are left or the feed runs out
+    page, from_cache, start = {}, True, 0
+    while entries:
+        start += len(entries)
+        scores = {post_id: score for post_id, score in entries}
+        posts, cached = await load_feed_posts(r, db, scores)
+        from_cache = from_cache and cached
+        page.update({post_id: (scores[post_id], post) for post_id, post in posts.items()
+                     if post["owner_id"] in authors})
+        if len(page) > limit or len(entries) <= limit:
+            break
+        entries = await r.zrevrangebyscore(key, max_score, "-inf", start=start, num=limit + 1, withscores=True)
+    page = list(page.values())
+
+    # Fan-out-on-read for followed accounts that are too big to fan out on write
+    if celebrities:
+        from_cache = False
+        query = select(models.Post)\
+            .where(models.Post.owner_id.in_(celebrities))\
+            .order_by(models.Post.createdAt.desc())\
+            .limit(limit + 1)
+        if before is not None:
+            query = query.where(models.Post.createdAt < datetime.fromtimestamp(before, timezone.utc))
+        rows = (await db.execute(query)).scalars().all()
+        known = {post["id"] for _, post in page}
+        page += [(post_timestamp(post.createdAt), {"id": post.id, "title": post.title, "content": post.content,
+                                                   "published": post.published, "createdAt": post.createdAt,
+                                                   "owner_id": post.owner_id, "likes": post.like_count})
+                 for post in rows if post.id not in known]
+
+    page.sort(key=lambda entry: (entry[0], entry[1]["id"]), reverse=True)
+    return page[:limit + 1], from_cache
@@ -1,12 +1,24 @@
-from app.kafka import kafka_init, kafka_processing
+from app.kafka import kafka_init, kafka_processing, kafka_utils
 import asyncio
+from app.config import settings
 from app.database import SessionLocal
+from app.metrics import start_metrics_server
 
 kafka_inst = kafka_init.Kafka()
 kafka_inst.add_topic()
+kafka_inst.add_topic(settings.kafka_likes_topic)
+kafka_inst.add_topic(settings.kafka_posts_dlq_topic)
+kafka_inst.add_topic(settings.kafka_likes_dlq_topic)
 producer, consumer = kafka_inst.producer, kafka_inst.consumer
+# Both consumers dead-letter messages they can't parse
+kafka_inst.start_polling()
+likes_consumer = kafka_utils.setup_consumer(settings.kafka_likes_topic, group_id='likes-group')
 
 db = SessionLocal()
+likes_db = SessionLocal()
+
+# Consumer batch sizes, lag and SQL timings for Prometheus
+start_metrics_server(settings.kafka_consumer_metrics_port)
 
 # class User:
 #     def __init__(self, id):
@@ -20,6 +32,9 @@ db = SessionLocal()
 async def main():
     # user = User(14)
     # await kafka_processing.write_post(producer, json.dumps(message), user)
-    await kafka_processing.poll_posts(consumer, db)
+    await asyncio.gather(
+        kafka_processing.poll_posts(consumer, db, kafka_producer=producer),
+        kafka_processing.poll_likes(likes_consumer, likes_db, kafka_producer=producer),
+    )
 
 asyncio.run(main())
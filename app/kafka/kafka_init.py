@@ -1,4 +1,6 @@
+import threading
 from .kafka_utils import add_kafka_topic, setup_producer, setup_consumer
+from ..config import settings
 # Initialize Kafka Topic, Producer and Consumers
 
 class Kafka:
@@ -14,8 +16,30 @@ class Kafka:
             self.initialized = True
             self.producer = setup_producer()
             self.consumer = setup_consumer()
+            self._poll_thread = None
+            self._stop_polling = threading.Event()
 
-    def add_topic(self):
-        add_kafka_topic()
+    def add_topic(self, topic_name = settings.kafka_posts_topic):
+        add_kafka_topic(topic_name)
         return
 
+    # Serve producer delivery reports from a dedicated thread
+    def start_polling(self):
+        if self._poll_thread is None:
+            self._stop_polling.clear()
+            self._poll_thread = threading.Thread(target=self._poll_loop, name="kafka-producer-poll", daemon=True)
+            self._poll_thread.start()
+
+    def _poll_loop(self):
+        while not self._stop_polling.is_set():
+            self.producer.poll(0.1)
+
+    # Stop polling and deliver whatever is still queued, only at shutdown
+    def close(self):
+        if self._poll_thread is not None:
+            self._stop_polling.set()
+            self._poll_thread.join()
+            self._poll_thread = None
+        remaining = self.producer.flush(settings.kafka_producer_flush_timeout)
+        if remaining:
+            print(f"{remaining} Kafka messages were not delivered before shutdown")
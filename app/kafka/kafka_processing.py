@@ -1,57 +1,455 @@
-from app import models
-from confluent_kafka import Consumer, Producer
+from app import models, metrics
+from confluent_kafka import Consumer, Producer, TopicPartition, KafkaException
 from ..config import settings
+from sqlalchemy import select, update, delete, tuple_, bindparam
+from collections import Counter
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+from datetime import datetime
 import time
 import json
-from ..utils import generate_base62_id
 import asyncio
 from app.database import SessionLocal
+from ..redis_cache import redis_session, get_pending_posts_raw, clear_pending_posts, is_tombstone, get_pending_post, \
+    discard_pending_post
+from ..feed import fan_out_posts
 db = SessionLocal()
 
-async def save_to_db(post, current_user_id, db: Session):
+POST_COLUMNS = {column.name for column in models.Post.__table__.columns}
+# Backoff while the DB is unreachable, the batch is retried until it goes through
+RETRY_BASE_DELAY = 0.1
+RETRY_MAX_DELAY = 30.0
+
+# Messages carry the whole post, owner_id included. Older messages were keyed "{owner_id}_{time}"
+def build_post_row(post: str, key: str = None):
+    post = json.loads(post)
+    row = {key: value for key, value in post.items() if key in POST_COLUMNS}
+    if row.get("owner_id") is None and key and "_" in key:
+        row["owner_id"] = int(key.split("_")[0])
+    if not row.get("id") or row.get("owner_id") is None:
+        raise ValueError("Post message without id or owner_id")
+    if isinstance(row.get("createdAt"), str):
+        row["createdAt"] = datetime.fromisoformat(row["createdAt"])
+    return row
+
+# Posts edited or deleted while still queued: persist their latest pending version
+def apply_pending(rows, pending):
+    applied = []
+    for row in rows:
+        value = pending.get(row["id"])
+        if value:
+            latest = json.loads(value)
+            if is_tombstone(latest):
+                continue
+            row = {**row, **{key: latest[key] for key in ("title", "content", "published") if key in latest}}
+        applied.append(row)
+    return applied
+
+# Apply pending posts that changed after the consumer read them, until they clear
+async def sync_pending_posts(r, db: Session, ids, attempts: int = 3):
+    for _ in range(attempts):
+        if not ids:
+            return
+        pending = await get_pending_posts_raw(r, ids)
+        for id, value in pending.items():
+            latest = json.loads(value)
+            if is_tombstone(latest):
+                db.execute(delete(models.Post).where(models.posts_by_id(id)))
+            else:
+                db.execute(update(models.Post).where(models.posts_by_id(id)).values(
+                    **{key: latest[key] for key in ("title", "content", "published") if key in latest}))
+        db.commit()
+        ids = await clear_pending_posts(r, pending)
+
+# Idempotent multi-row insert: posts redelivered after a crash hit ON CONFLICT and are skipped.
+# The key is (id, createdAt), the partitioned table's primary key; a redelivery carries the same createdAt.
+# Returns the ids that were inserted now
+def insert_posts(rows, db: Session):
+    inserted = db.execute(pg_insert(models.Post)
+                          .values(rows)
+                          .on_conflict_do_nothing(index_elements=[models.Post.id, models.Post.createdAt])
+                          .returning(models.Post.id)).scalars().all()
+    db.commit()
+    return set(inserted)
+
+# Insert a batch, retrying for as long as the DB is unreachable.
+# Other errors come from the data and are raised to the caller
+async def save_batch_to_db(rows, db: Session):
+    delay = RETRY_BASE_DELAY
+    while True:
+        try:
+            return insert_posts(rows, db)
+        except OperationalError as e:
+            db.rollback()
+            print(f"Batch Error, retrying in {delay}s: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RETRY_MAX_DELAY)
+        except SQLAlchemyError:
+            db.rollback()
+            raise
+
+# Park a message that can't be ingested on the dead-letter topic so it doesn't block the partition
+def send_to_dead_letter(kafka_producer: Producer, msg, error, topic_name: str = settings.kafka_posts_dlq_topic):
+    produce_dead_letter(kafka_producer, topic_name, msg.key(), msg.value(), error,
+                        (msg.topic(), msg.partition(), msg.offset()))
+
+# A like event that parsed but can't be applied, as its coalesced final state.
+# position is the (topic, partition, offset) of the oldest message behind it
+def dead_letter_like(kafka_producer: Producer, pair, action, position, error):
+    post_id, user_id = pair
+    event = {"post_id": post_id, "user_id": user_id, "action": action}
+    produce_dead_letter(kafka_producer, settings.kafka_likes_dlq_topic, post_id, json.dumps(event), error, position)
+
+def produce_dead_letter(kafka_producer: Producer, topic_name: str, key, value, error, position):
+    topic, partition, offset = position
+    print(f"Dead-lettering message {key}: {error}")
+    metrics.kafka_dead_letters.inc(topic=topic)
+    if kafka_producer is None:
+        return
+    headers = {"error": str(error)[:1000], "topic": topic, "partition": str(partition), "offset": str(offset)}
+    while True:
+        try:
+            kafka_producer.produce(topic_name, key=key, value=value, headers=headers, on_delivery=delivery_report)
+            return
+        except BufferError:
+            kafka_producer.poll(0.05)
+
+def delivery_report(err, msg):
+    if err is not None:
+        metrics.kafka_produce_errors.inc(topic=msg.topic())
+        print(f"Delivery failed for {msg.key()}: {err}")
+    elif msg.latency() is not None:
+        metrics.kafka_produce_latency.observe(msg.latency(), topic=msg.topic())
+
+# A post the broker never accepted (the producer gave up retrying) won't reach posts_2.
+# Drop it from the pending layer and the cache now, instead of serving it until the pending entry expires
+async def discard_undelivered_post(post_id: str):
+    try:
+        async with redis_session() as r:
+            await discard_pending_post(r, post_id)
+        print(f"Discarded undelivered post {post_id}")
+    except Exception as e:
+        print(f"Discarding undelivered post {post_id} failed: {e}")
+
+# Delivery reports run on the producer's poll thread, the cleanup is handed to the app's event loop
+def post_delivery_report(loop: asyncio.AbstractEventLoop):
+    def report(err, msg):
+        delivery_report(err, msg)
+        if err is not None:
+            asyncio.run_coroutine_threadsafe(discard_undelivered_post(msg.key().decode('utf-8')), loop)
+    return report
+
+# Enqueue only: delivery reports are served by Kafka.start_polling, flushing happens at shutdown.
+# Keyed by post id, so retries and redeliveries of a post stay on one partition
+async def write_post(kafka_producer: Producer, message: str, post_id: str, topic_name: str = settings.kafka_posts_topic):
+    on_delivery = post_delivery_report(asyncio.get_running_loop())
+    while True:
+        try:
+            kafka_producer.produce(topic_name, key=post_id, value=message, on_delivery=on_delivery)
+            return
+        except BufferError:
+            # Local queue is full, give the poll thread a moment to drain it
+            await asyncio.sleep(0.05)
+
+# Like/unlike events are keyed by post id so every event of a post lands on one partition, in order
+async def write_like(kafka_producer: Producer, post_id: str, user_id: int, is_like: bool = True, topic_name: str = settings.kafka_likes_topic):
+    event = {"post_id": post_id, "user_id": user_id, "action": "like" if is_like else "unlike"}
+    while True:
+        try:
+            kafka_producer.produce(topic_name, key=post_id, value=json.dumps(event), on_delivery=delivery_report)
+            return
+        except BufferError:
+            await asyncio.sleep(0.05)
+
+# A like event is {"post_id": str, "user_id": int, "action": "like" | "unlike"}
+def parse_like_event(value: bytes):
+    event = json.loads(value.decode('utf-8'))
+    if not isinstance(event, dict) or not event.get("post_id") or event.get("action") not in ("like", "unlike"):
+        raise ValueError("Like message without post_id or a like/unlike action")
+    return {"post_id": str(event["post_id"]), "user_id": int(event["user_id"]), "action": event["action"]}
+
+# Keep only the last event per (post, user): like -> unlike -> like collapses to a single like
+def coalesce_likes(events):
+    final = {}
+    for event in events:
+        final[(event["post_id"], int(event["user_id"]))] = event["action"]
+    likes = [pair for pair, action in final.items() if action == "like"]
+    unlikes = [pair for pair, action in final.items() if action == "unlike"]
+    return likes, unlikes
+
+# Apply a coalesced batch of likes/unlikes to likes_2 and posts_2.like_count in one transaction
+async def save_likes_to_db(likes, unlikes, db: Session):
     try:
-        post = json.loads(post)
-        new_post = models.Post(**post)
-        new_post.owner_id = current_user_id
-        db.add(new_post)
+        # Only rows that really changed count towards like_count
+        deltas = Counter()
+        if likes:
+            inserted = db.execute(pg_insert(models.Likes)
+                                  .values([{"post_id": post_id, "user_id": user_id} for post_id, user_id in likes])
+                                  .on_conflict_do_nothing()
+                                  .returning(models.Likes.post_id)).scalars().all()
+            deltas.update(inserted)
+        if unlikes:
+            deleted = db.execute(delete(models.Likes)
+                                 .where(tuple_(models.Likes.post_id, models.Likes.user_id).in_(unlikes))
+                                 .returning(models.Likes.post_id)).scalars().all()
+            deltas.subtract(deleted)
+        deltas = [{"post_id": post_id, "delta": delta} for post_id, delta in deltas.items() if delta]
+        if deltas:
+            db.execute(update(models.Post.__table__)
+                       .where(models.Post.id == bindparam("post_id"))
+                       .values(like_count=models.Post.like_count + bindparam("delta")),
+                       deltas)
         db.commit()
-        db.refresh(new_post)
-        print(new_post.id, new_post.title, new_post.content)
-        return new_post
     except Exception as e:
         print(f"Error: {e}")
         db.rollback()
+        raise
+
+# Split off events for posts that aren't in posts_2 (yet)
+def split_missing_posts(likes, unlikes, db: Session):
+    post_ids = {post_id for post_id, _ in likes + unlikes}
+    if not post_ids:
+        return likes, unlikes, {}
+    existing = set(db.execute(select(models.Post.id).where(models.posts_by_id(*post_ids))).scalars().all())
+    missing = {}
+    for action, pairs in (("like", likes), ("unlike", unlikes)):
+        for post_id, user_id in pairs:
+            if post_id not in existing:
+                missing[(post_id, user_id)] = action
+    likes = [pair for pair in likes if pair[0] in existing]
+    unlikes = [pair for pair in unlikes if pair[0] in existing]
+    return likes, unlikes, missing
 
-async def write_post(kafka_producer: Producer, message: str, current_user, topic_name: str = settings.kafka_posts_topic):
-    key = str(current_user.id)
-    kafka_producer.produce(topic_name, key=f"{key}_{time.time()}", value=message)
-    kafka_producer.flush()
-    time.sleep(5)
+# Events for posts still pending in the write-behind queue are held back until the post is persisted,
+# events for posts that are gone are dropped. Returns the held (post_id, user_id) -> action
+async def hold_pending_likes(missing: dict):
+    held = {}
+    if not missing:
+        return held
+    async with redis_session() as r:
+        for post_id in {post_id for post_id, _ in missing}:
+            events = {pair: action for pair, action in missing.items() if pair[0] == post_id}
+            pending = await get_pending_post(r, post_id)
+            if pending and not is_tombstone(pending):
+                held.update(events)
+            else:
+                print(f"Dropping {len(events)} like events for missing post {post_id}")
+    return held
 
-async def poll_posts(kafka_consumer: Consumer, db: Session):
+# Apply a batch of like events on top of the ones held back from earlier batches.
+# Held events are older than anything in the batch, so a newer event for the same (post, user)
+# replaces them and ordering is kept. events and the held dicts map
+# event -> (topic, partition, offset) of the oldest message behind it.
+# Returns the events still held and how many were dead-lettered
+async def save_likes_batch(events, held: dict, db: Session, kafka_producer: Producer = None):
+    ordered = [({"post_id": post_id, "user_id": user_id, "action": action}, position)
+               for (post_id, user_id), (action, position) in held.items()] + events
+    positions = {}
+    for event, position in ordered:
+        positions.setdefault((event["post_id"], event["user_id"]), position)
+
+    likes, unlikes = coalesce_likes(event for event, _ in ordered)
+    likes, unlikes, missing = split_missing_posts(likes, unlikes, db)
+    still_held = await hold_pending_likes(missing)
+
+    dead_letters = 0
     try:
-        while True:  # Continuous polling loop
-            msg = kafka_consumer.poll(timeout=10)
+        await save_likes_to_db(likes, unlikes, db)
+    except OperationalError:
+        # DB unreachable, retry_batch retries the whole batch
+        raise
+    except SQLAlchemyError:
+        # Fall back to event by event so one bad event (an unknown user, an out of range id)
+        # doesn't block the partition. Re-applying the good ones is idempotent
+        for action, pairs in (("like", likes), ("unlike", unlikes)):
+            for pair in pairs:
+                try:
+                    await save_likes_to_db(*(([pair], []) if action == "like" else ([], [pair])), db)
+                except OperationalError:
+                    raise
+                except SQLAlchemyError as e:
+                    dead_letter_like(kafka_producer, pair, action, positions[pair], e)
+                    dead_letters += 1
+    print(f"Applied {len(likes)} likes, {len(unlikes)} unlikes, holding {len(still_held)} for pending posts")
+    return {pair: (action, positions[pair]) for pair, action in still_held.items()}, dead_letters
 
-            if msg is None:
-                print("No messages yet.")
-                continue
+# Commit past the batch, but not past the oldest held-back event of a partition:
+# if the consumer restarts, held events are redelivered (re-applying the others is idempotent)
+def like_commit_offsets(batch, held: dict):
+    offsets = {}
+    for msg in batch:
+        offsets[(msg.topic(), msg.partition())] = msg.offset() + 1
+    for _, (topic, partition, offset) in held.values():
+        offsets[(topic, partition)] = min(offsets.get((topic, partition), offset), offset)
+    return [TopicPartition(topic, partition, offset) for (topic, partition), offset in offsets.items()]
 
+# Batch size and per-partition lag against the cached high watermark (no broker round trip)
+def record_consumer_metrics(kafka_consumer: Consumer, batch):
+    metrics.kafka_consumer_batch_size.observe(len(batch), topic=batch[0].topic())
+    last_offsets = {}
+    for msg in batch:
+        last_offsets[(msg.topic(), msg.partition())] = msg.offset()
+    for (topic, partition), offset in last_offsets.items():
+        try:
+            watermarks = kafka_consumer.get_watermark_offsets(TopicPartition(topic, partition), cached=True)
+        except KafkaException:
+            continue
+        if watermarks:
+            metrics.kafka_consumer_lag.set(max(watermarks[1] - offset - 1, 0), topic=topic, partition=partition)
+
+# Collect up to batch_size messages, or whatever arrived before the max latency deadline
+async def consume_batch(kafka_consumer: Consumer, batch_size: int, max_latency: float):
+    batch = []
+    deadline = time.monotonic() + max_latency
+    while len(batch) < batch_size:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        # consume() blocks, keep it off the event loop
+        msgs = await asyncio.to_thread(kafka_consumer.consume, batch_size - len(batch), remaining)
+        for msg in msgs:
             if msg.error():
                 print(f"Message Error: {msg.error()}")
                 continue
+            batch.append(msg)
+    return batch
+
+# Run one batch step until it goes through. A Redis or DB outage backs off and retries the same
+# batch, whose offsets stay uncommitted meanwhile (a restart redelivers it); the loop never exits
+async def retry_batch(step, db: Session, *args):
+    delay = RETRY_BASE_DELAY
+    while True:
+        try:
+            return await step(*args)
+        except Exception as e:
+            db.rollback()
+            print(f"Batch Error, retrying in {delay}s: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RETRY_MAX_DELAY)
 
-            key = msg.key().decode('utf-8').split("_")[0]
-            current_user_id = int(key)
+# Synchronous offset commit, a failed commit only means the batch may be redelivered
+def commit_offsets(kafka_consumer: Consumer, offsets=None):
+    try:
+        if offsets is None:
+            kafka_consumer.commit(asynchronous=False)
+        else:
+            kafka_consumer.commit(offsets=offsets, asynchronous=False)
+    except KafkaException as e:
+        print(f"Commit Error: {e}")
 
-            await save_to_db(msg.value().decode('utf-8'), current_user_id=current_user_id, db=db)
-            print(f"Received: {msg.value().decode('utf-8')}")
+# Persist a parsed batch of posts. Safe to retry: inserts are idempotent, and `inserted`
+# carries the ids inserted by an earlier attempt so they are still fanned out.
+# Returns how many messages were dead-lettered
+async def save_posts_batch(rows, sources, db: Session, kafka_producer: Producer, inserted: set):
+    async with redis_session() as r:
+        pending = await get_pending_posts_raw(r, [row["id"] for row in rows])
+    rows = apply_pending(rows, pending)
 
-            commit_result = kafka_consumer.commit(message=msg, asynchronous=False)
+    dead_letters = 0
+    if rows:
+        try:
+            inserted |= await save_batch_to_db(rows, db)
+        except SQLAlchemyError:
+            # Fall back to row by row so one bad post doesn't sink the batch
+            saved = []
+            for row in rows:
+                try:
+                    inserted |= await save_batch_to_db([row], db)
+                    saved.append(row)
+                except SQLAlchemyError as e:
+                    send_to_dead_letter(kafka_producer, sources[row["id"]], e)
+                    dead_letters += 1
+            rows = saved
 
+    # Push the newly persisted posts into followers' home feeds
+    new_rows = [row for row in rows if row["id"] in inserted]
+    if new_rows:
+        try:
+            async with redis_session() as r:
+                await fan_out_posts(r, db, new_rows)
+        except Exception as e:
+            # Feeds are a cache, don't hold back ingestion for them
+            print(f"Feed fan-out Error: {e}")
 
-            await asyncio.sleep(0.5)
-    except Exception as e:
-        print(f"Error: {e}")
-        db.rollback()
+    # Persisted (or dropped) posts are no longer pending
+    saved_ids = {row["id"] for row in rows}
+    persisted = {id: value for id, value in pending.items()
+                 if id in saved_ids or is_tombstone(json.loads(value))}
+    async with redis_session() as r:
+        changed = await clear_pending_posts(r, persisted)
+        await sync_pending_posts(r, db, changed)
+    return dead_letters
+
+async def poll_posts(kafka_consumer: Consumer, db: Session,
+                     batch_size: int = settings.kafka_consumer_batch_size,
+                     max_latency: float = settings.kafka_consumer_max_latency,
+                     kafka_producer: Producer = None):
+    while True:  # Continuous polling loop
+        try:
+            batch = await consume_batch(kafka_consumer, batch_size, max_latency)
+        except KafkaException as e:
+            print(f"Consume Error: {e}")
+            await asyncio.sleep(RETRY_BASE_DELAY)
+            continue
+
+        if not batch:
+            continue
+        record_consumer_metrics(kafka_consumer, batch)
+
+        rows, sources, dead_letters = [], {}, 0
+        for msg in batch:
+            try:
+                row = build_post_row(msg.value().decode('utf-8'), msg.key().decode('utf-8') if msg.key() else None)
+            except (ValueError, TypeError, UnicodeDecodeError) as e:
+                send_to_dead_letter(kafka_producer, msg, e)
+                dead_letters += 1
+                continue
+            # A post redelivered within the batch is inserted once
+            if row["id"] not in sources:
+                rows.append(row)
+            sources[row["id"]] = msg
+
+        inserted = set()
+        dead_letters += await retry_batch(save_posts_batch, db, rows, sources, db, kafka_producer, inserted)
+        print(f"Received batch of {len(batch)} posts, {len(inserted)} new")
+
+        # Dead letters must be on the broker before their offsets are committed
+        if dead_letters and kafka_producer is not None:
+            await asyncio.to_thread(kafka_producer.flush, settings.kafka_producer_flush_timeout)
+        # One synchronous offset commit per batch
+        commit_offsets(kafka_consumer)
+
+async def poll_likes(kafka_consumer: Consumer, db: Session,
+                     batch_size: int = settings.kafka_consumer_batch_size,
+                     max_latency: float = settings.kafka_consumer_max_latency,
+                     kafka_producer: Producer = None):
+    held = {}
+    while True:  # Continuous polling loop
+        try:
+            batch = await consume_batch(kafka_consumer, batch_size, max_latency)
+        except KafkaException as e:
+            print(f"Consume Error: {e}")
+            await asyncio.sleep(RETRY_BASE_DELAY)
+            continue
+
+        if not batch:
+            continue
+        record_consumer_metrics(kafka_consumer, batch)
+
+        events, dead_letters = [], 0
+        for msg in batch:
+            try:
+                events.append((parse_like_event(msg.value()), (msg.topic(), msg.partition(), msg.offset())))
+            except (ValueError, TypeError, KeyError, AttributeError) as e:
+                send_to_dead_letter(kafka_producer, msg, e, settings.kafka_likes_dlq_topic)
+                dead_letters += 1
+        print(f"Received batch of {len(batch)} like events")
+
+        held, failed = await retry_batch(save_likes_batch, db, events, held, db, kafka_producer)
+        dead_letters += failed
+
+        # Dead letters must be on the broker before their offsets are committed
+        if dead_letters and kafka_producer is not None:
+            await asyncio.to_thread(kafka_producer.flush, settings.kafka_producer_flush_timeout)
+        commit_offsets(kafka_consumer, like_commit_offsets(batch, held))
@@ -2,15 +2,26 @@ from confluent_kafka import Producer, Consumer
 from confluent_kafka.admin import AdminClient, NewTopic
 from ..config import settings
 import uuid
-def get_producer_config():
+def get_admin_config():
     return {'bootstrap.servers': f'localhost:{settings.kafka_port}'}
 
+def get_producer_config():
+    return {
+        'bootstrap.servers': f'localhost:{settings.kafka_port}',
+        'linger.ms': settings.kafka_producer_linger_ms,
+        'batch.size': settings.kafka_producer_batch_size,
+        'compression.type': settings.kafka_producer_compression,
+        'acks': settings.kafka_producer_acks,
+        # No duplicates or reordering from producer retries
+        'enable.idempotence': settings.kafka_producer_idempotence
+    }
+
 def setup_producer():
     producer = Producer(get_producer_config())
     return producer
 
 def add_kafka_topic(topic_name = settings.kafka_posts_topic):
-    admin_client = AdminClient(get_producer_config())
+    admin_client = AdminClient(get_admin_config())
     metadata = admin_client.list_topics(timeout=10)
 
     if topic_name not in metadata.topics:
@@ -20,16 +31,16 @@ def add_kafka_topic(topic_name = settings.kafka_posts_topic):
     else:
         print(f"Topic '{topic_name}' already exists.")
 
-def get_consumer_config():
+def get_consumer_config(group_id = 'posts-group'):
     return {
         'bootstrap.servers': f'localhost:{settings.kafka_port}',
-        'group.id': f'posts-group',
+        'group.id': group_id,
         'auto.offset.reset': 'earliest',
         'enable.auto.commit': False
     }
 
-def setup_consumer(topic_name = settings.kafka_posts_topic):
-    print(f"Consumer config:{get_consumer_config()}")
-    consumer = Consumer(get_consumer_config())
+def setup_consumer(topic_name = settings.kafka_posts_topic, group_id = 'posts-group'):
+    print(f"Consumer config:{get_consumer_config(group_id)}")
+    consumer = Consumer(get_consumer_config(group_id))
     consumer.subscribe([topic_name])
     return consumer
@@ -0,0 +1,53 @@
+import argparse
+import re
+from sqlalchemy import func, select, update
+from . import migrations, models
+from .database import engine
+
+# Maintenance commands, run with: python -m app.manage <command>
+
+def reconcile_likes():
+    # The like_count column comes from the migrations, run `migrate` first on older databases
+    with engine.begin() as conn:
+        # Reconcile: recount likes_2 and fix only the posts that drifted
+        counts = select(models.Post.id, func.count(models.Likes.post_id).label("likes"))\
+            .join(models.Likes, models.Likes.post_id == models.Post.id, isouter=True)\
+            .group_by(models.Post.id)\
+            .subquery()
+        result = conn.execute(update(models.Post.__table__)
+                              .where(models.Post.id == counts.c.id)
+                              .where(models.Post.like_count != counts.c.likes)
+                              .values(like_count=counts.c.likes))
+        print(f"Reconciled like_count on {result.rowcount} posts")
+
+def migrate(args):
+    applied = migrations.migrate()
+    print(f"Applied {len(applied)} migrations" if applied else "Schema is up to date")
+    print(f"Created {migrations.ensure_post_partitions()} posts_2 partitions")
+
+def create_partitions(args):
+    print(f"Created {migrations.ensure_post_partitions()} posts_2 partitions")
+
+def detach_partitions(args):
+    if not args.before or not re.match(r"^\d{4}-\d{2}$", args.before):
+        raise SystemExit("detach-partitions needs --before YYYY-MM")
+    detached = migrations.detach_post_partitions(args.before)
+    print(f"Detached {len(detached)} posts_2 partitions")
+
+COMMANDS = {
+    "reconcile-likes": lambda args: reconcile_likes(),
+    "migrate": migrate,
+    "create-partitions": create_partitions,
+    "detach-partitions": detach_partitions,
+}
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m app.manage")
+    parser.add_argument("command", choices=COMMANDS)
+    # detach-partitions: monthly posts_2 partitions before this month are detached
+    parser.add_argument("--before", help="YYYY-MM")
+    args = parser.parse_args()
+    COMMANDS[args.command](args)
+
+if __name__ == "__main__":
+    main()
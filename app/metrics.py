@@ -0,0 +1,207 @@
+import bisect
+import threading
+import time
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from sqlalchemy import event
+
+# Minimal Prometheus metrics: counters, gauges and histograms rendered in the text exposition format.
+# Updates are a dict lookup and an add under a per-metric lock, cheap enough to leave on.
+REGISTRY = []
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+def format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            items = list(self.values.items())
+        for key, value in items:
+            lines.extend(self.render_sample(key, value))
+        return lines
+
+    def render_sample(self, key, value):
+        return [f"{self.name}{format_labels(self.labelnames, key)} {format_value(value)}"]
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                # Per-bucket counts (last one is +Inf), sum, count
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render_sample(self, key, state):
+        counts, total, count = state
+        lines, cumulative = [], 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            labels = format_labels(self.labelnames, key, [("le", format_value(bound))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# HTTP
+http_requests = Counter("http_requests_total", "HTTP requests", ("method", "route", "status"))
+http_request_duration = Histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+http_request_statements = Histogram("http_request_db_statements", "SQL statements per HTTP request",
+                                    ("route",), COUNT_BUCKETS)
+http_request_db_time = Histogram("http_request_db_seconds", "Time spent in SQL per HTTP request", ("route",))
+
+# SQL
+db_statements = Counter("db_statements_total", "SQL statements executed", ("operation",))
+db_statement_duration = Histogram("db_statement_duration_seconds", "SQL statement latency", ("operation",))
+
+# Caches: tier is "l1" (in-process) or "redis", family is the key family (post, user, likers, ...)
+cache_requests = Counter("cache_requests_total", "Cache lookups", ("tier", "family", "result"))
+
+# Kafka
+kafka_produce_latency = Histogram("kafka_produce_latency_seconds", "Time from produce() to delivery report", ("topic",))
+kafka_produce_errors = Counter("kafka_produce_errors_total", "Failed deliveries", ("topic",))
+kafka_consumer_batch_size = Histogram("kafka_consumer_batch_size", "Messages per consumed batch", ("topic",),
+                                      (1, 5, 10, 25, 50, 100, 250, 500, 1000))
+kafka_consumer_lag = Gauge("kafka_consumer_lag", "Messages behind the partition high watermark", ("topic", "partition"))
+kafka_dead_letters = Counter("kafka_dead_letters_total", "Messages sent to a dead-letter topic", ("topic",))
+
+def record_cache(family: str, hit: bool, tier: str = "redis", count: int = 1):
+    if count:
+        cache_requests.inc(count, tier=tier, family=family, result="hit" if hit else "miss")
+
+# SQL statement counts and time of the current request, set by MetricsMiddleware
+request_db_usage = ContextVar("request_db_usage", default=None)
+
+def instrument_engine(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        db_statements.inc(operation=operation)
+        db_statement_duration.observe(elapsed, operation=operation)
+        usage = request_db_usage.get()
+        if usage is not None:
+            usage[0] += 1
+            usage[1] += elapsed
+
+# Pure ASGI middleware: latency, status and SQL usage per route template
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = [500]
+        usage = [0, 0.0]
+        # (elapsed, statements, DB time) once the last body chunk is sent. BackgroundTasks run
+        # after that inside self.app, their time and SQL aren't the request's
+        sent = []
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False) and not sent:
+                sent.append((time.perf_counter() - start, *usage))
+
+        token = request_db_usage.set(usage)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed, statements, db_time = sent[0] if sent else (time.perf_counter() - start, *usage)
+            request_db_usage.reset(token)
+            # Route templates keep label cardinality bounded
+            route = getattr(scope.get("route"), "path", "unmatched")
+            http_requests.inc(method=scope["method"], route=route, status=status[0])
+            http_request_duration.observe(elapsed, method=scope["method"], route=route)
+            http_request_statements.observe(statements, route=route)
+            http_request_db_time.observe(db_time, route=route)
+
+# /metrics for processes without FastAPI (the Kafka consumer)
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port: int):
+    server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
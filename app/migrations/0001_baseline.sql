@@ -0,0 +1,48 @@
+-- Schema as created by Base.metadata.create_all before migrations existed.
+-- IF NOT EXISTS everywhere, so databases created that way adopt it unchanged.
+CREATE SCHEMA IF NOT EXISTS "fastapi-db";
+
+CREATE TABLE IF NOT EXISTS "fastapi-db".users_2 (
+    id SERIAL NOT NULL,
+    email VARCHAR NOT NULL,
+    password VARCHAR NOT NULL,
+    "createdAt" TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL,
+    PRIMARY KEY (id),
+    UNIQUE (id),
+    UNIQUE (email)
+);
+
+CREATE TABLE IF NOT EXISTS "fastapi-db".follows_2 (
+    follower_id INTEGER NOT NULL,
+    followee_id INTEGER NOT NULL,
+    "createdAt" TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL,
+    PRIMARY KEY (follower_id, followee_id),
+    FOREIGN KEY (follower_id) REFERENCES "fastapi-db".users_2 (id) ON DELETE CASCADE,
+    FOREIGN KEY (followee_id) REFERENCES "fastapi-db".users_2 (id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS ix_follows_2_followee_id ON "fastapi-db".follows_2 (followee_id);
+
+CREATE TABLE IF NOT EXISTS "fastapi-db".posts_2 (
+    id VARCHAR(6) NOT NULL,
+    title VARCHAR NOT NULL,
+    content VARCHAR NOT NULL,
+    published BOOLEAN DEFAULT 'TRUE' NOT NULL,
+    "createdAt" TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL,
+    owner_id INTEGER NOT NULL,
+    like_count INTEGER DEFAULT '0' NOT NULL,
+    PRIMARY KEY (id),
+    FOREIGN KEY (owner_id) REFERENCES "fastapi-db".users_2 (id) ON DELETE CASCADE
+);
+-- Databases created before the denormalized like count
+ALTER TABLE "fastapi-db".posts_2 ADD COLUMN IF NOT EXISTS like_count INTEGER NOT NULL DEFAULT 0;
+CREATE INDEX IF NOT EXISTS ix_posts_2_createdat_id ON "fastapi-db".posts_2 ("createdAt", id);
+CREATE INDEX IF NOT EXISTS ix_posts_2_search ON "fastapi-db".posts_2
+    USING gin (to_tsvector('english', (title || ' ') || content));
+
+CREATE TABLE IF NOT EXISTS "fastapi-db".likes_2 (
+    post_id VARCHAR NOT NULL,
+    user_id INTEGER NOT NULL,
+    PRIMARY KEY (post_id, user_id),
+    FOREIGN KEY (post_id) REFERENCES "fastapi-db".posts_2 (id),
+    FOREIGN KEY (user_id) REFERENCES "fastapi-db".users_2 (id)
+);
@@ -0,0 +1,89 @@
+-- posts_2 range-partitioned by month on "createdAt" (UTC months, posts_2_pYYYY_MM),
+-- plus a default partition for rows outside every month partition.
+-- Recent-post queries bounded on "createdAt" only touch the newest partitions,
+-- and old months can be detached without rewriting the table.
+
+-- The primary key of a partitioned table has to include the partition key, so post ids
+-- are no longer a valid foreign key target: likes_2 loses its reference to posts_2
+-- (the likes consumer already checks that the post exists).
+ALTER TABLE "fastapi-db".likes_2 DROP CONSTRAINT IF EXISTS likes_2_post_id_fkey;
+
+ALTER TABLE "fastapi-db".posts_2 RENAME TO posts_2_unpartitioned;
+ALTER TABLE "fastapi-db".posts_2_unpartitioned RENAME CONSTRAINT posts_2_pkey TO posts_2_unpartitioned_pkey;
+DROP INDEX "fastapi-db".ix_posts_2_createdat_id;
+DROP INDEX "fastapi-db".ix_posts_2_search;
+
+CREATE TABLE "fastapi-db".posts_2 (
+    id VARCHAR(6) NOT NULL,
+    title VARCHAR NOT NULL,
+    content VARCHAR NOT NULL,
+    published BOOLEAN DEFAULT 'TRUE' NOT NULL,
+    "createdAt" TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL,
+    owner_id INTEGER NOT NULL,
+    like_count INTEGER DEFAULT '0' NOT NULL,
+    CONSTRAINT posts_2_pkey PRIMARY KEY (id, "createdAt"),
+    CONSTRAINT posts_2_owner_id_fkey FOREIGN KEY (owner_id) REFERENCES "fastapi-db".users_2 (id) ON DELETE CASCADE
+) PARTITION BY RANGE ("createdAt");
+
+CREATE TABLE "fastapi-db".posts_2_default PARTITION OF "fastapi-db".posts_2 DEFAULT;
+
+-- Create the partition of the month containing `month`, false if it already exists.
+-- Built detached and attached afterwards, so rows that landed in the default partition
+-- for that month are moved over instead of failing the attach.
+CREATE OR REPLACE FUNCTION "fastapi-db".create_posts_partition(month DATE) RETURNS BOOLEAN AS $$
+DECLARE
+    first_day DATE := date_trunc('month', month)::DATE;
+    partition_name TEXT := 'posts_2_p' || to_char(first_day, 'YYYY_MM');
+    start_at TIMESTAMPTZ := first_day::TIMESTAMP AT TIME ZONE 'UTC';
+    end_at TIMESTAMPTZ := (first_day + INTERVAL '1 month')::TIMESTAMP AT TIME ZONE 'UTC';
+BEGIN
+    IF to_regclass(format('"fastapi-db".%I', partition_name)) IS NOT NULL THEN
+        RETURN FALSE;
+    END IF;
+    EXECUTE format('CREATE TABLE "fastapi-db".%I (LIKE "fastapi-db".posts_2 INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+                   partition_name);
+    EXECUTE format('WITH moved AS (DELETE FROM "fastapi-db".posts_2_default '
+                   'WHERE "createdAt" >= $1 AND "createdAt" < $2 RETURNING *) '
+                   'INSERT INTO "fastapi-db".%I SELECT * FROM moved', partition_name)
+        USING start_at, end_at;
+    EXECUTE format('ALTER TABLE "fastapi-db".posts_2 ATTACH PARTITION "fastapi-db".%I FOR VALUES FROM (%L) TO (%L)',
+                   partition_name, start_at, end_at);
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Partitions for the current month and the next months_ahead months, returns how many were created
+CREATE OR REPLACE FUNCTION "fastapi-db".ensure_posts_partitions(months_ahead INTEGER) RETURNS INTEGER AS $$
+DECLARE
+    created INTEGER := 0;
+BEGIN
+    FOR i IN 0..months_ahead LOOP
+        IF "fastapi-db".create_posts_partition(
+                (date_trunc('month', now() AT TIME ZONE 'UTC') + make_interval(months => i))::DATE) THEN
+            created := created + 1;
+        END IF;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- One partition per month that already has posts, then copy them over
+SELECT "fastapi-db".create_posts_partition(month)
+FROM (SELECT DISTINCT date_trunc('month', "createdAt" AT TIME ZONE 'UTC')::DATE AS month
+      FROM "fastapi-db".posts_2_unpartitioned) months;
+SELECT "fastapi-db".ensure_posts_partitions(3);
+
+INSERT INTO "fastapi-db".posts_2 (id, title, content, published, "createdAt", owner_id, like_count)
+SELECT id, title, content, published, "createdAt", owner_id, like_count FROM "fastapi-db".posts_2_unpartitioned;
+DROP TABLE "fastapi-db".posts_2_unpartitioned;
+
+-- Indexes on the parent are created on every partition, present and future
+-- Keyset pagination over ("createdAt", id)
+CREATE INDEX ix_posts_2_createdat_id ON "fastapi-db".posts_2 ("createdAt", id);
+-- Posts of a set of users in a time range (feed, per-user listings)
+CREATE INDEX ix_posts_2_createdat_owner_id ON "fastapi-db".posts_2 ("createdAt", owner_id);
+-- Only visible posts
+CREATE INDEX ix_posts_2_published_createdat ON "fastapi-db".posts_2 ("createdAt") WHERE published;
+-- A few pages per partition for time-range scans, rows arrive roughly in "createdAt" order
+CREATE INDEX ix_posts_2_createdat_brin ON "fastapi-db".posts_2 USING brin ("createdAt");
+CREATE INDEX ix_posts_2_search ON "fastapi-db".posts_2 USING gin (to_tsvector('english', (title || ' ') || content));
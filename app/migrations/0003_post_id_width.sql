@@ -0,0 +1,5 @@
+-- Post ids become 11-character time-ordered base62 (utils.generate_post_id).
+-- Under the "C" collation string order is byte order, which is creation order for these ids:
+-- new ids append at the tail of the primary key index, and ORDER BY id is chronological.
+-- Existing 6-character random ids stay valid, they just don't sort by time.
+ALTER TABLE "fastapi-db".posts_2 ALTER COLUMN id TYPE VARCHAR(11) COLLATE "C";
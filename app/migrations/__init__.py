@@ -0,0 +1,90 @@
+import asyncio
+import os
+import re
+from sqlalchemy import text
+from ..config import settings
+from .. import database
+
+# Versioned schema migrations: NNNN_name.sql files in this directory, applied in order
+# and recorded in "fastapi-db".schema_migrations. Run with: python -m app.manage migrate
+MIGRATIONS_DIR = os.path.dirname(os.path.abspath(__file__))
+MIGRATION_FILE = re.compile(r"^(\d{4})_(\w+)\.sql$")
+# Advisory lock key, only one process migrates at a time (every worker migrates on startup)
+MIGRATION_LOCK = 4262001
+
+def migration_files():
+    files = []
+    for name in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = MIGRATION_FILE.match(name)
+        if match:
+            files.append((int(match.group(1)), name))
+    return files
+
+# Apply pending migrations, each in its own transaction. Returns the names applied
+def migrate():
+    applied_now = []
+    with database.engine.connect() as conn:
+        # Session-level lock, held across the per-migration transactions
+        conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK})
+        conn.commit()
+        try:
+            with conn.begin():
+                conn.execute(text('CREATE SCHEMA IF NOT EXISTS "fastapi-db"'))
+                conn.execute(text('CREATE TABLE IF NOT EXISTS "fastapi-db".schema_migrations ('
+                                  'version INTEGER PRIMARY KEY, name VARCHAR NOT NULL, '
+                                  '"appliedAt" TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW())'))
+                applied = set(conn.execute(text('SELECT version FROM "fastapi-db".schema_migrations')).scalars())
+
+            for version, name in migration_files():
+                if version in applied:
+                    continue
+                with open(os.path.join(MIGRATIONS_DIR, name)) as f:
+                    sql = f.read()
+                with conn.begin():
+                    # Whole file in one call, no bind parameters (the SQL contains % and $ literally)
+                    conn.execution_options(no_parameters=True).exec_driver_sql(sql)
+                    conn.execute(text('INSERT INTO "fastapi-db".schema_migrations (version, name) '
+                                      'VALUES (:version, :name)'), {"version": version, "name": name})
+                print(f"Applied migration {name}")
+                applied_now.append(name)
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK})
+            conn.commit()
+    return applied_now
+
+# Create posts_2 partitions up to posts_partition_months_ahead months from now, returns how many were created
+def ensure_post_partitions():
+    with database.engine.begin() as conn:
+        return conn.execute(text('SELECT "fastapi-db".ensure_posts_partitions(:months)'),
+                            {"months": settings.posts_partition_months_ahead}).scalar()
+
+# Background task: the next months' partitions exist before the first post lands in them
+async def maintain_post_partitions():
+    while True:
+        try:
+            created = await asyncio.to_thread(ensure_post_partitions)
+            if created:
+                print(f"Created {created} posts_2 partitions")
+        except Exception as e:
+            print(f"posts_2 partition maintenance failed: {e}")
+        await asyncio.sleep(settings.posts_partition_check_interval)
+
+# Detach (not drop) the monthly partitions that end on or before the first day of `before` (YYYY-MM).
+# The detached tables keep their rows, archive or drop them separately. Returns their names
+def detach_post_partitions(before: str):
+    cutoff = "posts_2_p" + before.replace("-", "_")
+    with database.engine.begin() as conn:
+        partitions = conn.execute(text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "JOIN pg_namespace ON pg_namespace.oid = parent.relnamespace "
+            "WHERE pg_namespace.nspname = 'fastapi-db' AND parent.relname = 'posts_2'")).scalars().all()
+        old = sorted(name for name in partitions if re.match(r"^posts_2_p\d{4}_\d{2}$", name) and name < cutoff)
+        # A catalog-only change, but it needs a brief exclusive lock on posts_2 (CONCURRENTLY isn't allowed
+        # next to a default partition): give up rather than queue every query behind a long-running one
+        conn.execute(text("SET LOCAL lock_timeout = '5s'"))
+        for name in old:
+            conn.exec_driver_sql(f'ALTER TABLE "fastapi-db".posts_2 DETACH PARTITION "fastapi-db"."{name}"')
+            print(f"Detached {name}")
+    return old
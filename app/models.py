@@ -1,27 +1,62 @@
 from .database import Base
-from sqlalchemy import Column, ForeignKey, Integer, String, Boolean
-from sqlalchemy.sql.expression import text
+from sqlalchemy import Column, ForeignKey, Index, Integer, String, Boolean, and_
+from sqlalchemy.sql.expression import text, func
 from sqlalchemy.sql.sqltypes import TIMESTAMP
 from sqlalchemy.orm import relationship
+from .utils import post_id_time_range
 
 # SQLAlchemy Models
 # Used for defining columns on tables
 # And simplify CRUD operations within DB
 # Without directly using SQL Queries
 
+# Range-partitioned by month on createdAt, the schema is managed by app/migrations
+# (0002_partition_posts.sql), the indexes here mirror it
 class Post(Base):
     __tablename__ = "posts_2"
-    __table_args__ = {'schema': 'fastapi-db'}
+    __table_args__ = (
+        # Backs keyset pagination over (createdAt, id)
+        Index("ix_posts_2_createdat_id", "createdAt", "id"),
+        Index("ix_posts_2_createdat_owner_id", "createdAt", "owner_id"),
+        Index("ix_posts_2_published_createdat", "createdAt", postgresql_where=text("published")),
+        Index("ix_posts_2_createdat_brin", "createdAt", postgresql_using="brin"),
+        {'schema': 'fastapi-db', 'postgresql_partition_by': 'RANGE ("createdAt")'},
+    )
 
-    id = Column(String(6), primary_key=True, nullable=False)
+    # utils.generate_post_id, byte-wise ("C") order is creation order
+    id = Column(String(11, collation="C"), primary_key=True, nullable=False)
     title = Column(String, nullable=False)
     content = Column(String, nullable=False)
     published = Column(Boolean, server_default='TRUE', nullable=False)
-    createdAt = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('NOW()'))
+    # Part of the primary key because it is the partition key
+    createdAt = Column(TIMESTAMP(timezone=True), primary_key=True, nullable=False, server_default=text('NOW()'))
     owner_id = Column(Integer,
                     ForeignKey("fastapi-db.users_2.id",
                     ondelete="CASCADE"),
                     nullable = False)
+    # Denormalized COUNT(*) of likes_2, kept in sync by the likes consumer
+    like_count = Column(Integer, nullable=False, server_default='0')
+
+# Full-text document over title and content.
+# Shared by the GIN index and the search queries so the planner can match them
+def post_search_document():
+    columns = Post.__table__.c
+    return func.to_tsvector(text("'english'"),
+                            columns.title.op("||")(text("' '")).op("||")(columns.content))
+
+def post_search_query(tsquery: str):
+    return func.to_tsquery(text("'english'"), tsquery)
+
+Index("ix_posts_2_search", post_search_document(), postgresql_using="gin")
+
+# Condition matching the posts with these ids. The ids carry their creation time, bounding createdAt
+# by it lets Postgres skip the posts_2 partitions they can't be in (not done if any id predates that format)
+def posts_by_id(*ids):
+    condition = Post.id == ids[0] if len(ids) == 1 else Post.id.in_(ids)
+    ranges = [post_id_time_range(id) for id in ids]
+    if ranges and all(ranges):
+        condition = and_(condition, Post.createdAt.between(min(lo for lo, _ in ranges), max(hi for _, hi in ranges)))
+    return condition
 
 
 class User(Base):
@@ -32,12 +67,24 @@ class User(Base):
     password = Column(String, nullable=False)
     createdAt = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('NOW()'))
 
+# Follow graph: follower_id follows followee_id
+# primary key serves "who do I follow", the followee index serves fan-out
+class Follow(Base):
+    __tablename__ = "follows_2"
+    __table_args__ = (
+        Index("ix_follows_2_followee_id", "followee_id"),
+        {'schema': 'fastapi-db'},
+    )
+    follower_id = Column(Integer, ForeignKey("fastapi-db.users_2.id", ondelete="CASCADE"), primary_key=True)
+    followee_id = Column(Integer, ForeignKey("fastapi-db.users_2.id", ondelete="CASCADE"), primary_key=True)
+    createdAt = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('NOW()'))
+
 # User can only like a post once
 # Create new table likes
 # primary key = post id + user id
-#
+# post_id has no foreign key, posts_2 is partitioned and its primary key is (id, createdAt)
 class Likes(Base):
     __tablename__ = "likes_2"
     __table_args__ = {'schema': 'fastapi-db'}
-    post_id = Column(String, ForeignKey("fastapi-db.posts_2.id"), primary_key=True)
+    post_id = Column(String, primary_key=True)
     user_id = Column(Integer, ForeignKey("fastapi-db.users_2.id"), primary_key=True)
@@ -1,3 +1,5 @@
+import asyncio
+import json
 import jwt
 import os
 from datetime import datetime, timedelta, timezone
@@ -5,14 +7,20 @@ from dotenv import load_dotenv
 from jwt import PyJWTError
 from fastapi import Depends, status, HTTPException
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+import redis.asyncio as redis
 
-from .database import get_db
+from .database import read_session, replicas
+from .redis_cache import get_redis, redis_session
+from .ttl_cache import TTLCache
+from . import metrics
 from . import schemas
 from . import models
 from .config import settings
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='login')
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl='login', auto_error=False)
 # Get the parent directory
 parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 
@@ -54,11 +62,111 @@ async def verify_access_token(token: str):
 
     return token_data
 
+# Authenticated principals keyed by user id, so most requests skip the users_2 lookup.
+# L1 is per worker, user:{id} in Redis is shared by all workers. Neither holds the password hash.
+user_cache = TTLCache(maxsize=settings.user_cache_max_size, ttl=settings.user_cache_ttl)
+
+def user_cache_key(user_id):
+    return f"user:{user_id}"
+
+def user_principal(user: models.User):
+    return {"id": user.id, "email": user.email, "createdAt": user.createdAt.isoformat() if user.createdAt else None}
+
+# Detached User built from a cached principal, a fresh instance per request
+def user_from_principal(principal: dict):
+    created_at = principal["createdAt"]
+    return models.User(id=principal["id"], email=principal["email"],
+                       createdAt=datetime.fromisoformat(created_at) if created_at else None)
+
+async def invalidate_user(user_id, r: redis.Redis | None = None):
+    user_cache.delete(user_id)
+    if not settings.user_cache_redis:
+        return
+    if r is not None:
+        await r.delete(user_cache_key(user_id))
+        return
+    async with redis_session() as r:
+        await r.delete(user_cache_key(user_id))
+
+# Any ORM change to a user drops its cached principal
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _invalidate_changed_user(mapper, connection, target):
+    user_cache.delete(target.id)
+    try:
+        asyncio.get_running_loop().create_task(invalidate_user(target.id))
+    except RuntimeError:
+        # Sync session outside the event loop, the Redis copy expires on its own
+        pass
+
+# Read-your-writes: after a write the user reads from the primary until replicas had time to catch up
+def primary_sticky_key(user_id):
+    return f"rw:{user_id}"
+
+async def mark_primary_sticky(r: redis.Redis, user_id):
+    if not replicas.engines:
+        return
+    try:
+        await r.set(primary_sticky_key(user_id), 1, px=int(settings.database_read_your_writes_window * 1000))
+    except redis.RedisError:
+        pass
+
+# Session for read-only endpoints: a replica, or the primary for users who wrote recently
+async def get_read_db(token: str | None = Depends(optional_oauth2_scheme),
+                      r: redis.Redis = Depends(get_redis)):
+    primary = False
+    if replicas.healthy and token:
+        try:
+            user_id = jwt.decode(token, SECRET_KEY, ALGORITHM).get("user_id")
+        except PyJWTError:
+            user_id = None
+        if user_id:
+            try:
+                primary = bool(await r.exists(primary_sticky_key(user_id)))
+            except redis.RedisError:
+                # Can't tell, stay consistent
+                primary = True
+    async with read_session(primary) as db:
+        yield db
+
 async def get_current_user(token: str = Depends(oauth2_scheme),
-                           db: Session = Depends(get_db)):
+                           db: AsyncSession = Depends(get_read_db),
+                           r: redis.Redis = Depends(get_redis)):
 
     token_data = await verify_access_token(token)
-    query = db.query(models.User).filter(models.User.id == token_data.id)
-    user = query.first()
+    user_id = int(token_data.id)
+
+    principal = user_cache.get(user_id)
+    metrics.record_cache("user", principal is not None, tier="l1")
+    if principal is not None:
+        return user_from_principal(principal)
+
+    if settings.user_cache_redis:
+        try:
+            cached = await r.get(user_cache_key(user_id))
+        except redis.RedisError:
+            cached = None
+        metrics.record_cache("user", bool(cached))
+        if cached:
+            principal = json.loads(cached)
+            user_cache.set(user_id, principal)
+            return user_from_principal(principal)
+
+    query = select(models.User).filter(models.User.id == user_id)
+    user = (await db.execute(query)).scalars().first()
+    if not user and replicas.engines:
+        # A user created moments ago may not have reached the replica yet
+        async with read_session(primary=True) as primary_db:
+            user = (await primary_db.execute(query)).scalars().first()
+    if not user:
+        raise credentials_exception
+
+    principal = user_principal(user)
+    user_cache.set(user_id, principal)
+    if settings.user_cache_redis:
+        try:
+            await r.set(user_cache_key(user_id), json.dumps(principal), ex=settings.user_cache_redis_ttl)
+        except redis.RedisError:
+            pass
     return user
 
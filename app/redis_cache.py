@@ -1,19 +1,179 @@
 import asyncio
-import redis
+import json
+import math
+import random
+import re
+import secrets
+import time
+import redis.asyncio as redis
 from contextlib import asynccontextmanager
-from redis.commands.json.path import Path
-from . import schemas
+from redis.commands.search.query import Query, NumericFilter
+from redis.exceptions import ResponseError
+from . import schemas, utils
+from .config import settings
+from .database import read_session
+from .ttl_cache import TTLCache
+from . import metrics
 
-LRU_CACHE_KEY = "lru_cache_key"
-MAX_CACHE_SIZE = 100
+# Recency of cached post:* keys, a sorted set scored by last access time
+LRU_CACHE_KEY = "post_lru"
+CACHE_STATS_KEY = "cache_stats"
+# Every post created at or after this timestamp is cached (see search_posts)
+COVERAGE_KEY = "post_cache_coverage"
+# Extra rows fetched from the index to skip ties with the cursor
+CURSOR_SLACK = 10
+
+# Touch keys and evict the least recently used ones past the max size, atomically.
+# Evicting a post means posts created before it may be missing from the cache,
+# so the coverage watermark moves up to the evicted post's createdAt.
+# KEYS[1] = LRU sorted set, KEYS[2] = stats hash, KEYS[3] = coverage watermark
+# ARGV[1] = now, ARGV[2] = max size, ARGV[3..] = keys to touch
+TOUCH_AND_EVICT_SCRIPT = """
+for i = 3, #ARGV do
+    redis.call('ZADD', KEYS[1], ARGV[1], ARGV[i])
+end
+local overflow = redis.call('ZCARD', KEYS[1]) - tonumber(ARGV[2])
+if overflow > 0 then
+    local evicted = redis.call('ZPOPMIN', KEYS[1], overflow)
+    local coverage = tonumber(redis.call('GET', KEYS[3]))
+    for i = 1, #evicted, 2 do
+        if coverage then
+            local ok, created = pcall(redis.call, 'JSON.GET', evicted[i], '$.createdAt')
+            if ok and created then
+                local value = cjson.decode(created)[1]
+                if value and value > coverage then
+                    coverage = value
+                end
+            end
+        end
+        redis.call('DEL', evicted[i])
+    end
+    if coverage then
+        redis.call('SET', KEYS[3], coverage)
+    end
+    redis.call('HINCRBY', KEYS[2], 'evictions', overflow)
+end
+return math.max(overflow, 0)
+"""
+
+# Set of user ids that liked a post, the sentinel marks the set as loaded from the DB
+LIKERS_SENTINEL = "*"
+LIKERS_TTL = 86400
+
+# Like counts: the likers:{id} set is the authoritative count (SCARD minus the sentinel) while it is loaded,
+# the DB's like_count trails it by the likes still in Kafka. Cached docs take their likes from it.
+#
+# Cache a post doc, then take its likes from the likers set
+# KEYS[1] = post key, KEYS[2] = likers key, ARGV[1] = post doc, ARGV[2] = "1" to replace a cached doc
+FILL_POST_SCRIPT = """
+if ARGV[2] == '1' then
+    redis.call('JSON.SET', KEYS[1], '$', ARGV[1])
+else
+    redis.call('JSON.SET', KEYS[1], '$', ARGV[1], 'NX')
+end
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    redis.call('JSON.SET', KEYS[1], '$.likes', redis.call('SCARD', KEYS[2]) - 1)
+end
+return 1
+"""
+
+# Set a cached post's likes from the likers set, if both are in Redis
+# KEYS[1] = post key, KEYS[2] = likers key
+SYNC_LIKE_COUNT_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 or redis.call('EXISTS', KEYS[2]) == 0 then
+    return 0
+end
+redis.call('JSON.SET', KEYS[1], '$.likes', redis.call('SCARD', KEYS[2]) - 1)
+return 1
+"""
+
+# Posts accepted by create_post but not yet persisted by the Kafka consumer.
+# pending:post:{id} holds the latest version of the post (or a tombstone once deleted)
+# so read and mutate paths can find it before it reaches Postgres.
+PENDING_TTL = 86400
+PENDING_TOMBSTONE = {"deleted": True}
+
+# Delete a pending post only if nobody changed it since the consumer read it
+# KEYS[1] = pending key, ARGV[1] = value the consumer persisted
+CLEAR_PENDING_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    return 1
+end
+return 0
+"""
+
+# Delete a lock only if it still holds our token: it may have expired and been taken by someone else
+# KEYS[1] = lock key, ARGV[1] = token
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Cache fills: at most one DB load per post at a time.
+# Concurrent misses in a worker share one in-flight fill, across workers the
+# fill:post:{id} lease picks a single loader and the others wait for its result.
+FILL_LOCK_PREFIX = "fill:post:"
+FILL_POLL_INTERVAL = 0.05
+inflight_fills = {}
+
+# L1: per-worker cache of hot post:* docs in front of Redis, short TTL bounds staleness.
+# Writers publish the post id on INVALIDATION_CHANNEL after changing it, every worker drops its copy.
+INVALIDATION_CHANNEL = "post_invalidations"
+post_l1 = TTLCache(maxsize=settings.post_l1_max_size, ttl=settings.post_l1_ttl)
+
+# App-lifetime connection pool, shared by every request
+redis_pool: redis.ConnectionPool | None = None
+
+def init_redis_pool():
+    global redis_pool
+    if redis_pool is None:
+        redis_pool = redis.ConnectionPool(
+            host=settings.redis_hostname,
+            port=settings.redis_port,
+            db=settings.redis_db,
+            max_connections=settings.redis_max_connections,
+            health_check_interval=settings.redis_health_check_interval,
+            decode_responses=True,
+        )
+    return redis_pool
+
+async def close_redis_pool():
+    global redis_pool
+    if redis_pool is not None:
+        await redis_pool.disconnect()
+        redis_pool = None
+
+# FastAPI dependency: client bound to the shared pool
+async def get_redis():
+    r = redis.Redis(connection_pool=init_redis_pool())
+    try:
+        yield r
+    finally:
+        # Returns the connection to the pool, the pool itself stays open
+        await r.aclose()
 
 @asynccontextmanager
 async def redis_session():
-    r = redis.Redis(host="localhost", port=6379, db=0, decode_responses=True)
+    r = redis.Redis(connection_pool=init_redis_pool())
     try:
         yield r
     finally:
-        r.close()
+        await r.aclose()
+
+# Post id worker ids handed out round-robin, two live processes only share one after 1024 more startups
+POST_ID_WORKER_KEY = "post_id:worker"
+
+async def claim_post_id_worker():
+    if settings.post_id_worker >= 0:
+        worker_id = settings.post_id_worker
+    else:
+        async with redis_session() as r:
+            worker_id = (await r.incr(POST_ID_WORKER_KEY) - 1) % (utils.POST_ID_MAX_WORKER + 1)
+    utils.post_ids.set_worker_id(worker_id)
+    return worker_id
 
 async def init_redis():
     from redis.commands.search.field import NumericField, TextField, TagField
@@ -24,64 +184,377 @@ async def init_redis():
             TextField("$.title", as_name="title"),
             TextField("$.content", as_name="content"),
             NumericField("$.owner_id", as_name="owner_id"),
-            NumericField("$.likes", as_name="likes"),
+            NumericField("$.likes", as_name="likes", sortable=True),
             TagField("$.published", as_name="published"),  # boolean
-            NumericField("$.createdAt", as_name="createdAt")
+            NumericField("$.createdAt", as_name="createdAt", sortable=True)
         )
 
+        # Posts are written through on creation, so from now on the cache holds every new post
+        await r.set(COVERAGE_KEY, time.time(), nx=True)
+
+        # Let Redis evict post:* keys itself (they all carry a TTL)
+        if settings.redis_cache_eviction == "native" and settings.redis_maxmemory:
+            await r.config_set("maxmemory", settings.redis_maxmemory)
+            await r.config_set("maxmemory-policy", settings.redis_maxmemory_policy)
+
         index = r.ft("posts")
-        index.create_index(
-            schema,
-            definition=IndexDefinition(prefix=["post:"], index_type=IndexType.JSON),
-        )
+        try:
+            await index.create_index(
+                schema,
+                definition=IndexDefinition(prefix=["post:"], index_type=IndexType.JSON),
+            )
+        except ResponseError:
+            # Index already exists
+            pass
 
-async def update_like_count(id, is_like=True):
-    async with redis_session() as r:
-        key = f"post:{id}"
+# Queue recency update + eviction for post keys on a pipeline
+def touch_posts(pipe, *keys):
+    if settings.redis_cache_eviction != "zset" or not keys:
+        return
+    pipe.eval(TOUCH_AND_EVICT_SCRIPT, 3, LRU_CACHE_KEY, CACHE_STATS_KEY, COVERAGE_KEY,
+              time.time(), settings.redis_cache_max_size, *keys)
 
-        # Use pipeline for atomic operations
-        async with r.pipeline(transaction=True) as pipe:
-            # Increment the like count or initialize it
-            val = 1 if is_like else -1
-            exists = await r.exists(key)
+# Count a cache hit or miss and refresh recency of the post on a hit
+async def record_cache_access(r: redis.Redis, id, hit: bool):
+    metrics.record_cache("post", hit)
+    async with r.pipeline(transaction=False) as pipe:
+        pipe.hincrby(CACHE_STATS_KEY, "hits" if hit else "misses", 1)
+        if hit:
+            touch_posts(pipe, f"post:{id}")
+        await pipe.execute()
 
-            if exists:
-                await pipe.json().numincrby(key, Path("$.likes"), val)
-            else:
-                initial_data = {"likes": 1 if is_like else 0}
-                await pipe.json().set(key, Path.root_path(), initial_data)
+async def get_cache_stats(r: redis.Redis):
+    stats = await r.hgetall(CACHE_STATS_KEY)
+    hits, misses = int(stats.get("hits", 0)), int(stats.get("misses", 0))
+    l1_lookups = post_l1.hits + post_l1.misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "evictions": int(stats.get("evictions", 0)),
+        "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+        "size": await r.zcard(LRU_CACHE_KEY),
+        # This worker's L1 only
+        "l1": {
+            "hits": post_l1.hits,
+            "misses": post_l1.misses,
+            "evictions": post_l1.evictions,
+            "hit_ratio": post_l1.hits / l1_lookups if l1_lookups else 0.0,
+            "size": len(post_l1),
+        },
+    }
 
-            await pipe.expire(key, 3600)  # Reset TTL to 1 hour on update
+# Drop a changed post from every worker's L1. Queue on the pipeline that changes it
+def queue_invalidation(pipe, id):
+    post_l1.delete(id)
+    pipe.publish(INVALIDATION_CHANNEL, id)
 
-            # Efficient LRU eviction logic using LMOVE (Redis 6.2+)
-            await pipe.lrem(LRU_CACHE_KEY, 0, key)  # Remove key if already present
-            await pipe.rpush(LRU_CACHE_KEY, key)     # Add key to end of LRU list
+async def invalidate_post(r: redis.Redis, id):
+    post_l1.delete(id)
+    await r.publish(INVALIDATION_CHANNEL, id)
 
-            # Eviction logic in the same transaction
-            if await r.llen(LRU_CACHE_KEY) >= MAX_CACHE_SIZE:
-                oldest_key = await pipe.lpop(LRU_CACHE_KEY)
-                await pipe.delete(oldest_key)
+# Background task applying other workers' invalidations to this worker's L1
+async def listen_for_invalidations():
+    while True:
+        try:
+            async with redis_session() as r:
+                async with r.pubsub(ignore_subscribe_messages=True) as pubsub:
+                    await pubsub.subscribe(INVALIDATION_CHANNEL)
+                    # Invalidations missed while disconnected are unknown
+                    post_l1.clear()
+                    async for message in pubsub.listen():
+                        post_l1.delete(message["data"])
+        except asyncio.CancelledError:
+            raise
+        except redis.RedisError as e:
+            print(f"Invalidation listener disconnected: {e}")
+            post_l1.clear()
+            await asyncio.sleep(1)
 
-            await pipe.execute()
+# JSONPath ("$") reads return a list of matches, None for missing keys
+def first_json_match(result):
+    if isinstance(result, list):
+        return result[0] if result else None
+    return result
 
-async def save_post_to_redis(post_out: schemas.PostOut):
-    async with redis_session() as r:
-        post_dict = post_out.model_dump()
-        post_dict["createdAt"] = post_dict["createdAt"].timestamp()  # Convert datetime to timestamp
-        post_dict["published"] = "1" if post_dict["published"] else "0"  # Convert boolean to string
-        key = f"post:{post_out.id}"
-        r.json().set(key, Path.root_path(), post_dict)
-        r.expire(key, 3600)  # Set TTL to 1 hour
-
-async def process_post_on_redis(post, likes, current_user_id=None):
-    # Construct full response object
-    post_out = schemas.PostOut(
+# Lower bound of createdAt for which the cache is known to be complete, None if unknown.
+# Posts younger than the TTL can't have expired, evictions raise the stored watermark.
+async def get_cache_coverage(r: redis.Redis):
+    if settings.redis_cache_eviction != "zset":
+        return None
+    since = await r.get(COVERAGE_KEY)
+    if since is None:
+        return None
+    return max(float(since), time.time() - min_post_ttl())
+
+def build_search_query(search: str):
+    tokens = re.findall(r"\w+", search or "")
+    if not tokens:
+        return "*"
+    # Prefix match needs at least two characters
+    terms = " ".join(f"{token}*" if len(token) > 1 else token for token in tokens)
+    return f"@title|content:({terms})"
+
+# Answer a createdAt-ordered page from the "posts" index.
+# Returns up to limit + 1 post dicts (the extra one signals a next page),
+# or None when the cache can't prove it holds every post of the window.
+async def search_posts(r: redis.Redis, search: str, limit: int, sort_asc: bool = True, cursor=None):
+    coverage = await get_cache_coverage(r)
+    if coverage is None:
+        return None
+
+    lo, hi = NumericFilter.NEG_INF, NumericFilter.INF
+    if cursor:
+        cursor_ts, cursor_id = cursor[0].timestamp(), cursor[1]
+        if sort_asc:
+            lo = cursor_ts
+        else:
+            hi = cursor_ts
+    # Oldest-first pages start at the cursor, which must be inside the covered window
+    if sort_asc and (not cursor or cursor_ts < coverage):
+        return None
+
+    query = Query(build_search_query(search))\
+        .add_filter(NumericFilter("createdAt", lo, hi))\
+        .sort_by("createdAt", asc=sort_asc)\
+        .paging(0, limit + 1 + CURSOR_SLACK)
+    result = await r.ft("posts").search(query)
+    posts = [json.loads(doc.json) for doc in result.docs]
+    posts.sort(key=lambda post: (post["createdAt"], post["id"]), reverse=not sort_asc)
+
+    if cursor:
+        if sort_asc:
+            posts = [post for post in posts if (post["createdAt"], post["id"]) > (cursor_ts, cursor_id)]
+        else:
+            posts = [post for post in posts if (post["createdAt"], post["id"]) < (cursor_ts, cursor_id)]
+    posts = posts[:limit + 1]
+
+    # Newest-first pages need coverage down to the last row looked at
+    if not sort_asc and (len(posts) <= limit or posts[-1]["createdAt"] < coverage):
+        return None
+    return posts
+
+async def delete_post_from_redis(r: redis.Redis, id):
+    key = f"post:{id}"
+    async with r.pipeline(transaction=True) as pipe:
+        pipe.delete(key, likers_key(id))
+        pipe.zrem(LRU_CACHE_KEY, key)
+        queue_invalidation(pipe, id)
+        await pipe.execute()
+
+# A pending post that will never be persisted (its message wasn't delivered): drop it and its cached copy
+async def discard_pending_post(r: redis.Redis, id):
+    key = f"post:{id}"
+    async with r.pipeline(transaction=True) as pipe:
+        pipe.delete(pending_key(id), key, likers_key(id))
+        pipe.zrem(LRU_CACHE_KEY, key)
+        queue_invalidation(pipe, id)
+        await pipe.execute()
+
+# After a like or unlike: the cached post's count follows the likers set.
+# An uncached post picks its count up from the set when it is filled
+async def update_like_count(r: redis.Redis, id):
+    key = f"post:{id}"
+    if not await r.exists(key):
+        await invalidate_post(r, id)
+        return
+
+    async with r.pipeline(transaction=True) as pipe:
+        # No-op if the key expired since the check
+        pipe.eval(SYNC_LIKE_COUNT_SCRIPT, 2, key, likers_key(id))
+        pipe.expire(key, post_ttl())  # Reset TTL on update
+        touch_posts(pipe, key)
+        queue_invalidation(pipe, id)
+        await pipe.execute()
+
+def likers_key(post_id):
+    return f"likers:{post_id}"
+
+async def save_likers(r: redis.Redis, post_id, user_ids):
+    key = likers_key(post_id)
+    async with r.pipeline(transaction=True) as pipe:
+        pipe.sadd(key, LIKERS_SENTINEL, *user_ids)
+        pipe.expire(key, LIKERS_TTL)
+        await pipe.execute()
+
+# Returns False if the user had already liked the post
+async def add_liker(r: redis.Redis, post_id, user_id):
+    key = likers_key(post_id)
+    async with r.pipeline(transaction=True) as pipe:
+        pipe.sadd(key, user_id)
+        pipe.expire(key, LIKERS_TTL)
+        added, _ = await pipe.execute()
+    return bool(added)
+
+# Returns False if the user hadn't liked the post
+async def remove_liker(r: redis.Redis, post_id, user_id):
+    removed = await r.srem(likers_key(post_id), user_id)
+    return bool(removed)
+
+def pending_key(id):
+    return f"pending:post:{id}"
+
+# xx=True only overwrites a post that is still pending. Returns whether it was saved
+async def save_pending_post(r: redis.Redis, post_dict: dict, xx: bool = False):
+    return bool(await r.set(pending_key(post_dict["id"]), json.dumps(post_dict, default=str), ex=PENDING_TTL, xx=xx))
+
+# Returns the pending post dict, a tombstone dict, or None if the post isn't pending
+async def get_pending_post(r: redis.Redis, id):
+    value = await r.get(pending_key(id))
+    return json.loads(value) if value else None
+
+def is_tombstone(pending: dict):
+    return pending.get("deleted", False)
+
+async def mark_pending_deleted(r: redis.Redis, id):
+    await r.set(pending_key(id), json.dumps(PENDING_TOMBSTONE), ex=PENDING_TTL, xx=True)
+
+# Raw pending values for a batch of ids, as read by the consumer
+async def get_pending_posts_raw(r: redis.Redis, ids):
+    if not ids:
+        return {}
+    values = await r.mget([pending_key(id) for id in ids])
+    return {id: value for id, value in zip(ids, values) if value}
+
+# Clear pending posts the consumer persisted. Returns the ids that changed in the meantime
+async def clear_pending_posts(r: redis.Redis, persisted: dict):
+    if not persisted:
+        return []
+    async with r.pipeline(transaction=False) as pipe:
+        for id, value in persisted.items():
+            pipe.eval(CLEAR_PENDING_SCRIPT, 1, pending_key(id), value)
+        cleared = await pipe.execute()
+    return [id for id, ok in zip(persisted, cleared) if not ok]
+
+def cached_post_doc(post_out: schemas.PostOut):
+    post_dict = post_out.model_dump()
+    post_dict["createdAt"] = post_dict["createdAt"].timestamp()  # Convert datetime to timestamp
+    post_dict["published"] = "1" if post_dict["published"] else "0"  # Convert boolean to string
+    return post_dict
+
+# TTLs are jittered down so keys cached together don't expire together
+def post_ttl():
+    return int(settings.redis_cache_ttl * (1 - settings.redis_cache_ttl_jitter * random.random()))
+
+def min_post_ttl():
+    return settings.redis_cache_ttl * (1 - settings.redis_cache_ttl_jitter)
+
+# Probabilistic early expiration (XFetch): the closer a cached post is to expiring,
+# the likelier a hit refreshes it, so a hot key is refilled by one request before it lapses
+def should_refresh_early(pttl_ms):
+    if pttl_ms is None or pttl_ms < 0:
+        return False
+    u = random.random() or 1e-12
+    return -settings.redis_cache_early_refresh_delta * settings.redis_cache_early_refresh_beta * math.log(u) \
+        >= pttl_ms / 1000
+
+# Write many posts with their TTLs and recency in a single pipeline.
+# Read-path fills leave a cached post as it is (JSON.SET NX): the cached doc carries the live like count
+# and the latest write, a row read from the DB may be older. Only write paths pass overwrite=True
+async def save_posts_to_redis(r: redis.Redis, post_outs, overwrite: bool = False):
+    if not post_outs:
+        return
+    keys = []
+    async with r.pipeline(transaction=False) as pipe:
+        for post_out in post_outs:
+            key = f"post:{post_out.id}"
+            pipe.eval(FILL_POST_SCRIPT, 2, key, likers_key(post_out.id), json.dumps(cached_post_doc(post_out)),
+                      "1" if overwrite else "0")
+            pipe.expire(key, post_ttl())
+            keys.append(key)
+        touch_posts(pipe, *keys)
+        await pipe.execute()
+
+# Cache fill after the response is sent (BackgroundTasks), on its own pooled client
+async def save_posts_in_background(post_outs):
+    try:
+        async with redis_session() as r:
+            await save_posts_to_redis(r, post_outs)
+    except redis.RedisError as e:
+        print(f"Cache fill of {len(post_outs)} posts failed: {e}")
+
+# Write path: the post was just created or edited
+async def save_post_to_redis(r: redis.Redis, post_out: schemas.PostOut):
+    await save_posts_to_redis(r, [post_out], overwrite=True)
+
+def build_post_out(post, likes, current_user_id=None):
+    return schemas.PostOut(
         id=post.id, title=post.title, content=post.content,
         published=post.published, createdAt=post.createdAt,
-        owner_id=post.owner_id if hasattr(post, "owner_id") else current_user_id,
+        owner_id=post.owner_id if getattr(post, "owner_id", None) is not None else current_user_id,
         likes=likes
     )
-    save_data_to_redis = asyncio.create_task(save_post_to_redis(post_out))
+
+async def process_post_on_redis(r: redis.Redis, post, likes, current_user_id=None):
+    # Construct full response object
+    post_out = build_post_out(post, likes, current_user_id)
     # Post Data to Redis Cache
-    await save_data_to_redis
+    await save_post_to_redis(r, post_out)
+    return post_out
+
+# Fill post:{id} with load(db) (returns a PostOut or None if there's no such post),
+# coalescing concurrent fills of the same post. Returns the PostOut or cached doc, or None.
+# refresh=True recomputes a cached post: it loads from the primary, a lagging replica could undo
+# a recent edit, and replaces the cached doc (its likes still come from the likers set)
+async def fill_post_cache(id, load, refresh: bool = False):
+    fill = inflight_fills.get(id)
+    if fill is None:
+        fill = asyncio.ensure_future(_fill_post_cache(id, load, refresh))
+        inflight_fills[id] = fill
+        fill.add_done_callback(lambda _: inflight_fills.pop(id, None))
+    # A cancelled request doesn't cancel the fill other requests wait on
+    return await asyncio.shield(fill)
+
+# The fill outlives the request that started it, so it loads on a session of its own
+async def load_and_cache(r: redis.Redis, load, refresh: bool = False):
+    async with read_session(primary=refresh) as db:
+        post_out = await load(db)
+    if post_out is not None:
+        await save_posts_to_redis(r, [post_out], overwrite=refresh)
+        if refresh:
+            await invalidate_post(r, post_out.id)
     return post_out
+
+async def _fill_post_cache(id, load, refresh: bool = False):
+    lock_key = FILL_LOCK_PREFIX + id
+    token = secrets.token_hex(8)
+    async with redis_session() as r:
+        if await r.set(lock_key, token, nx=True, px=settings.redis_cache_fill_lock_ms):
+            try:
+                return await load_and_cache(r, load, refresh)
+            finally:
+                await r.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+
+        # Another worker holds the lease: wait until it cached the post or gave up
+        deadline = time.monotonic() + settings.redis_cache_fill_lock_ms / 1000
+        while time.monotonic() < deadline:
+            await asyncio.sleep(FILL_POLL_INTERVAL)
+            async with r.pipeline(transaction=False) as pipe:
+                pipe.json().get(f"post:{id}")
+                pipe.exists(lock_key)
+                doc, locked = await pipe.execute()
+            if doc:
+                return doc
+            if not locked:
+                break
+        return await load_and_cache(r, load, refresh)
+
+# Cached docs for many posts in one JSON.MGET, keyed by id. Counts a hit or miss per id
+async def get_cached_posts(r: redis.Redis, ids):
+    if not ids:
+        return {}
+    docs = await r.json().mget([f"post:{id}" for id in ids], "$")
+    found = {}
+    for id, doc in zip(ids, docs):
+        doc = first_json_match(doc)
+        if doc:
+            found[id] = doc
+    metrics.record_cache("post", True, count=len(found))
+    metrics.record_cache("post", False, count=len(ids) - len(found))
+    async with r.pipeline(transaction=False) as pipe:
+        if found:
+            pipe.hincrby(CACHE_STATS_KEY, "hits", len(found))
+            touch_posts(pipe, *[f"post:{id}" for id in found])
+        if len(found) < len(ids):
+            pipe.hincrby(CACHE_STATS_KEY, "misses", len(ids) - len(found))
+        await pipe.execute()
+    return found
@@ -0,0 +1,42 @@
+import orjson
+from datetime import datetime, timezone
+from fastapi.responses import ORJSONResponse
+from . import schemas
+from .config import settings
+
+# Opt-in fast path for post responses (settings.fast_json_responses).
+# Endpoints return the Response themselves, so FastAPI doesn't re-validate data we built
+# (PostOut from DB rows, cached post docs) through response_model, and orjson encodes it.
+# Without the setting the helpers return the plain objects and response_model applies.
+class FastJSONResponse(ORJSONResponse):
+    def render(self, content):
+        # Z suffix for UTC, like Pydantic
+        return orjson.dumps(content, option=orjson.OPT_UTC_Z)
+
+# PostOut-shaped dict from a PostOut or a cached post doc
+def post_json(post):
+    if isinstance(post, schemas.PostOut):
+        return post.model_dump()
+    doc = dict(post)
+    # Cached docs store createdAt as a timestamp and published as "1"/"0"
+    if isinstance(doc.get("createdAt"), (int, float)):
+        doc["createdAt"] = datetime.fromtimestamp(doc["createdAt"], timezone.utc)
+    if isinstance(doc.get("published"), str):
+        doc["published"] = doc["published"] == "1"
+    return doc
+
+def post_response(post):
+    if not settings.fast_json_responses:
+        return post
+    return FastJSONResponse(post_json(post))
+
+def posts_response(posts):
+    if not settings.fast_json_responses:
+        return posts
+    return FastJSONResponse([post_json(post) for post in posts])
+
+def page_response(posts, next_cursor=None, source="postgres"):
+    if not settings.fast_json_responses:
+        return schemas.PostPage(posts=posts, next_cursor=next_cursor, source=source)
+    return FastJSONResponse({"posts": [post_json(post) for post in posts],
+                             "next_cursor": next_cursor, "source": source})
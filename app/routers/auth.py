@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends, status, HTTPException, Response
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.security import OAuth2PasswordRequestForm
 
 from .. import schemas, models, utils, oauth2
@@ -9,20 +10,22 @@ from ..database import get_db
 router = APIRouter(tags=["Authentication"])
 
 @router.post("/login", response_model= schemas.Token)
-async def login(user_credentials: OAuth2PasswordRequestForm = Depends(), db:Session = Depends(get_db)):
+async def login(user_credentials: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
     try:
-        query = db.query(models.User).filter(models.User.email == user_credentials.username)
-        user = query.first()
+        query = select(models.User).filter(models.User.email == user_credentials.username)
+        user = (await db.execute(query)).scalars().first()
         # User doesn't exist
         if not user:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail= f"Invalid Credentials (Email/Password Error)!")
         #Incorrect password
-        elif not utils.verify(user_credentials.password, user.password):
+        elif not await utils.verify_async(user_credentials.password, user.password):
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail= f"Invalid Credentials (Email/Password Error)!")
         # Valid credentials
         else:
             access_token = await oauth2.create_access_token(data = {"user_id": user.id})
             return schemas.Token(access_token=access_token, token_type="bearer")
+    except utils.PasswordHashBusy as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e), headers={"Retry-After": "1"})
     except HTTPException:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST
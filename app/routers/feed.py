@@ -0,0 +1,36 @@
+from fastapi import status, HTTPException, Depends, APIRouter, Query
+from datetime import datetime, timezone
+from typing import Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+import redis.asyncio as redis
+
+from ..redis_cache import get_redis
+from ..feed import read_feed
+from ..utils import encode_cursor, decode_cursor
+from ..responses import page_response
+from .. import models, schemas, oauth2
+
+router = APIRouter(prefix = "/feed", tags = ["feed"])
+
+# Largest page of GET /feed
+MAX_PAGE_SIZE = 100
+
+# Home feed of the current user: posts of followed accounts, newest first
+@router.get("", response_model=schemas.PostPage)
+async def get_feed(db: AsyncSession = Depends(oauth2.get_read_db),
+                   r: redis.Redis = Depends(get_redis),
+                   current_user: models.User = Depends(oauth2.get_current_user),
+                   limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None):
+    try:
+        before = decode_cursor(cursor)[0].timestamp() if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    page, from_cache = await read_feed(r, db, current_user.id, limit, before)
+
+    next_cursor = None
+    if len(page) > limit:
+        score, post = page[limit - 1]
+        next_cursor = encode_cursor(datetime.fromtimestamp(score, timezone.utc), post["id"])
+    return page_response([post for _, post in page[:limit]], next_cursor,
+                         source="redis" if from_cache else "postgres")
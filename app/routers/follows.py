@@ -0,0 +1,53 @@
+from fastapi import status, HTTPException, Depends, APIRouter
+from sqlalchemy import select, delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+import redis.asyncio as redis
+
+from ..database import get_db
+from ..redis_cache import get_redis
+from ..feed import add_following, remove_following
+from .. import models, schemas, oauth2
+
+router = APIRouter(
+    prefix = "/follow",
+    tags = ["Follow"]
+    )
+
+@router.post("/", status_code=status.HTTP_201_CREATED)
+async def follow(follow: schemas.Follow,
+         db: AsyncSession = Depends(get_db),
+         r: redis.Redis = Depends(get_redis),
+         current_user: models.User = Depends(oauth2.get_current_user)):
+    if follow.user_id == current_user.id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Users can't follow themselves")
+
+    user = (await db.execute(select(models.User.id).filter(models.User.id == follow.user_id))).scalars().first()
+    if not user:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"User id {follow.user_id} doesn't exist")
+
+    try:
+        db.add(models.Follow(follower_id = current_user.id, followee_id = follow.user_id))
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"User id {current_user.id} already follows user id {follow.user_id}")
+
+    await add_following(r, db, current_user.id, follow.user_id)
+    await oauth2.mark_primary_sticky(r, current_user.id)
+    return {"Message": f"User id {current_user.id} followed user id {follow.user_id} successfully!"}
+
+@router.delete("/", status_code=status.HTTP_204_NO_CONTENT)
+async def unfollow(follow: schemas.Follow,
+         db: AsyncSession = Depends(get_db),
+         r: redis.Redis = Depends(get_redis),
+         current_user: models.User = Depends(oauth2.get_current_user)):
+    result = await db.execute(delete(models.Follow).where(models.Follow.follower_id == current_user.id,
+                                                          models.Follow.followee_id == follow.user_id))
+    if not result.rowcount:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"User id {current_user.id} doesn't follow user id {follow.user_id}")
+    await db.commit()
+
+    await remove_following(r, db, current_user.id, follow.user_id)
+    await oauth2.mark_primary_sticky(r, current_user.id)
+    return {"Message": f"User id {current_user.id} unfollowed user id {follow.user_id} successfully!"}
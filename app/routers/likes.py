@@ -1,54 +1,85 @@
 from fastapi import status, HTTPException, Depends, APIRouter
 from redis.commands.json.path import Path
 
-from ..redis_cache import redis_session, update_like_count
+from ..redis_cache import get_redis, update_like_count, likers_key, save_likers, add_liker, remove_liker, \
+    get_pending_post, is_tombstone
+import redis.asyncio as redis
 from ..database import get_db
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from .. import models, schemas, oauth2
+from ..kafka.kafka_init import Kafka
+from ..kafka.kafka_processing import write_like
+from ..metrics import record_cache
 
 router = APIRouter(
     prefix = "/like",
     tags = ["Vote"]
     )
 
+# Make sure the post's likers set is in Redis, loading it from the DB on a cold cache
+# Returns False if the post doesn't exist
+async def load_likers(post_id: str, db: AsyncSession, r: redis.Redis):
+    cached = await r.exists(likers_key(post_id))
+    record_cache("likers", cached)
+    if cached:
+        return True
+
+    # A post still in the write-behind queue has no likes in the DB yet
+    pending = await get_pending_post(r, post_id)
+    if pending:
+        if is_tombstone(pending):
+            return False
+        await save_likers(r, post_id, [])
+        return True
+
+    post = (await db.execute(select(models.Post.id).filter(models.posts_by_id(post_id)))).scalars().first()
+    if not post:
+        return False
+
+    user_ids = (await db.execute(select(models.Likes.user_id).filter(models.Likes.post_id == post_id))).scalars().all()
+    await save_likers(r, post_id, user_ids)
+    return True
+
+# Likes are recorded in Redis (dedup set + counter) and written behind to likes_2 via Kafka
 @router.post("/", status_code=status.HTTP_201_CREATED)
 async def vote(vote: schemas.Like,
-         db: Session = Depends(get_db),
+         db: AsyncSession = Depends(get_db),
+         r: redis.Redis = Depends(get_redis),
          current_user: models.User = Depends(oauth2.get_current_user)):
-    post = db.query(models.Post).filter(models.Post.id == vote.post_id).first()
-    if not post:
+    if not await load_likers(vote.post_id, db, r):
        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Post id {vote.post_id} doesn't exist")
 
-    vote_query = db.query(models.Likes).filter(models.Likes.post_id == vote.post_id, models.Likes.user_id == current_user.id)
-    vote_result = vote_query.first()
-    if vote_result:
+    if not await add_liker(r, vote.post_id, current_user.id):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"User id {current_user.id} already liked post id {vote.post_id}")
     else:
         try:
-            new_like = models.Likes(post_id = vote.post_id, user_id = current_user.id)
-            db.add(new_like)
-            db.commit()
-            await update_like_count(vote.post_id, True)
+            await write_like(Kafka().producer, vote.post_id, current_user.id, True)
+            await update_like_count(r, vote.post_id)
             return {"Message": f"User id {current_user.id} liked Post id {vote.post_id} successfully!"}
         except Exception as e:
-            return {"Message": f'{str(e).replace('\n', '')}'}
+            await remove_liker(r, vote.post_id, current_user.id)
+            return {"Message": str(e).replace('\n', '')}
 
 @router.delete("/", status_code=status.HTTP_204_NO_CONTENT)
 async def unvote(vote: schemas.Like,
-         db: Session = Depends(get_db),
+         db: AsyncSession = Depends(get_db),
+         r: redis.Redis = Depends(get_redis),
          current_user: models.User = Depends(oauth2.get_current_user)):
-    post = db.query(models.Post).filter(models.Post.id == vote.post_id).first()
-    if not post:
+    if not await load_likers(vote.post_id, db, r):
        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail=f"Post id {vote.post_id} doesn't exist")
 
-    vote_query = db.query(models.Likes).filter(models.Likes.post_id == vote.post_id, models.Likes.user_id == current_user.id)
-    vote_result = vote_query.first()
-    if not vote_result:
+    if not await remove_liker(r, vote.post_id, current_user.id):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                     detail=f"User id {current_user.id} hasn't liked post id {vote.post_id} or post doesn't exist")
     else:
-        vote_query.delete(synchronize_session=False)
-        db.commit()
-        await update_like_count(vote.post_id, False)
+        try:
+            await write_like(Kafka().producer, vote.post_id, current_user.id, False)
+        except Exception as e:
+            # The unlike never reaches likes_2, so the user still likes the post
+            await add_liker(r, vote.post_id, current_user.id)
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail=str(e).replace('\n', ''))
+        await update_like_count(r, vote.post_id)
         return {f"Message": f"User id {current_user.id} disliked Post id {vote.post_id} successfully!"}
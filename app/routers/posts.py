@@ -1,10 +1,18 @@
-from fastapi import status, HTTPException, Depends, APIRouter, BackgroundTasks
-from sqlalchemy import func
+from fastapi import status, HTTPException, Depends, APIRouter, BackgroundTasks, Query
+from sqlalchemy import func, select, update, delete, tuple_
 from ..database import get_db
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
+from datetime import datetime, timezone
 from .. import models, schemas, oauth2
-from ..redis_cache import process_post_on_redis, redis_session
+from ..utils import encode_cursor, decode_cursor, build_tsquery
+from ..responses import post_response, posts_response, page_response
+from ..metrics import record_cache
+from ..redis_cache import process_post_on_redis, get_redis, record_cache_access, delete_post_from_redis, search_posts, \
+    save_pending_post, get_pending_post, mark_pending_deleted, is_tombstone, get_pending_posts_raw, get_cached_posts, \
+    save_posts_to_redis, build_post_out, save_posts_in_background, fill_post_cache, should_refresh_early, post_l1, \
+    invalidate_post
+import redis.asyncio as redis
 from redis.commands.json.path import Path
 import asyncio
 from ..kafka.kafka_init import Kafka
@@ -12,11 +20,19 @@ from ..kafka.kafka_processing import write_post
 router = APIRouter(prefix = "/posts", tags = ["posts"])
 import json
 
+# Fields a post owner can change
+EDITABLE_FIELDS = ("title", "content", "published")
+# Most ids accepted by GET /posts/batch
+MAX_BATCH_IDS = 100
+# Largest page of GET /posts
+MAX_PAGE_SIZE = 100
+
 # Write new post
 @router.post("", status_code=status.HTTP_201_CREATED, response_model=schemas.PostOut)
 async def create_post(post: schemas.PostCreate,
                       background_tasks: BackgroundTasks,
-                      db: Session = Depends(get_db),
+                      db: AsyncSession = Depends(get_db),
+                      r: redis.Redis = Depends(get_redis),
                       current_user: models.User = Depends(oauth2.get_current_user)):
     try:
 
@@ -31,74 +47,184 @@ async def create_post(post: schemas.PostCreate,
         # return result
         # Run both tasks concurrently
         # save_db_task = asyncio.create_task(save_to_db(post, current_user, db))
-        save_redis_task = asyncio.create_task(process_post_on_redis(post, 0, current_user.id))
+        save_redis_task = asyncio.create_task(process_post_on_redis(r, post, 0, current_user.id))
         kafka_producer = Kafka().producer
         post_data = post.model_dump()
         post_data['createdAt'] = post_data['createdAt'].isoformat()
+        post_data['owner_id'] = current_user.id
         # write_to_kafka = asyncio.create_task(write_post(kafka_producer, ))
-        results = await asyncio.gather(save_redis_task)
+        # Visible to read/mutate paths until the consumer persists it
+        save_pending_task = asyncio.create_task(save_pending_post(r, post_data))
+        results = await asyncio.gather(save_redis_task, save_pending_task)
+        await oauth2.mark_primary_sticky(r, current_user.id)
 
-        background_tasks.add_task(write_post, kafka_producer, json.dumps(post_data), current_user)
+        background_tasks.add_task(write_post, kafka_producer, json.dumps(post_data), post.id)
         return results[0]
     except HTTPException as e:
-        db.rollback()
-        async with redis_session() as r:
-            await r.delete(f"post:{post.id}")
+        await db.rollback()
+        await r.delete(f"post:{post.id}")
 
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"An error occurred while inserting into the database: {e}")
 
 # Read all posts, with query parameters
-@router.get("", response_model=List[schemas.PostOut])
-async def get_posts(db: Session = Depends(get_db),
+# Sorting by createdAt pages with an opaque keyset cursor over (createdAt, id)
+# and is answered from the RediSearch "posts" index when the cache covers the page.
+# search is a prefix full-text match on title and content, sortBy=relevance ranks the matches
+@router.get("", response_model=schemas.PostPage)
+async def get_posts(background_tasks: BackgroundTasks,
+                    db: AsyncSession = Depends(oauth2.get_read_db),
+                    r: redis.Redis = Depends(get_redis),
                     current_user: models.User = Depends(oauth2.get_current_user),
-                    limit: int = 5, sortBy: str = "createdAt", sortAsc: bool = True, search: Optional[str] = ""):
+                    limit: int = Query(5, ge=1, le=MAX_PAGE_SIZE), sortBy: str = "createdAt", sortAsc: bool = True, search: Optional[str] = "",
+                    cursor: Optional[str] = None):
+    tsquery = build_tsquery(search)
+    relevance = sortBy == "relevance"
+    if relevance and not tsquery:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Sorting by relevance needs a search")
+    if not relevance and sortBy not in models.Post.__table__.c:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Can't sort by {sortBy}")
+    keyset = sortBy == "createdAt"
+    if cursor and not keyset:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cursors are only supported when sorting by createdAt")
     try:
+        cursor_key = decode_cursor(cursor) if cursor else None
+
+        if keyset:
+            cached = await search_posts(r, search, limit, sortAsc, cursor_key)
+            record_cache("post_page", cached is not None)
+            if cached is not None:
+                next_cursor = None
+                if len(cached) > limit:
+                    last = cached[limit - 1]
+                    next_cursor = encode_cursor(datetime.fromtimestamp(last["createdAt"], timezone.utc), last["id"])
+                return page_response(cached[:limit], next_cursor, source="redis")
 
         # Handling query parameters
-        order = models.Post.__table__.c[sortBy].asc() if sortAsc else models.Post.__table__.c[sortBy].desc()
-        posts = db.query(models.Post, func.count(models.Likes.post_id).label("likes"))\
-            .join(models.Likes, models.Likes.post_id == models.Post.id, isouter=True)\
-            .group_by(models.Post.id)\
-            .filter(models.Post.title.contains(search))\
-            .order_by(order)\
-            .limit(limit).all()
+        if tsquery:
+            # Uses the ix_posts_2_search GIN index
+            document = models.post_search_document()
+            ts_query = models.post_search_query(tsquery)
+        if keyset:
+            # (createdAt, id) matches ix_posts_2_createdat_id, so deep pages are an index range scan
+            key = tuple_(models.Post.createdAt, models.Post.id)
+            order = [models.Post.createdAt.asc(), models.Post.id.asc()] if sortAsc \
+                else [models.Post.createdAt.desc(), models.Post.id.desc()]
+        elif relevance:
+            order = [func.ts_rank(document, ts_query).desc(), models.Post.id]
+        else:
+            order = [models.Post.__table__.c[sortBy].asc() if sortAsc else models.Post.__table__.c[sortBy].desc()]
+        # like_count is denormalized, so this is a plain index scan without a join or aggregate
+        query = select(models.Post)\
+            .order_by(*order)\
+            .limit(limit + 1)
+        if tsquery:
+            query = query.filter(document.op("@@")(ts_query))
+        if cursor_key:
+            created_at, last_id = cursor_key
+            query = query.filter(key > tuple_(created_at, last_id) if sortAsc else key < tuple_(created_at, last_id))
+            # Redundant with the row comparison, but lets Postgres skip posts_2 partitions past the cursor
+            query = query.filter(models.Post.createdAt >= created_at if sortAsc else models.Post.createdAt <= created_at)
+        posts = (await db.execute(query)).scalars().all()
+
+        # One extra row tells us whether there is a next page
+        has_next = len(posts) > limit
+        posts = posts[:limit]
 
-        response = []
+        response = [build_post_out(post, post.like_count) for post in posts]
+        # Cache the page in one pipeline once the response is sent
+        background_tasks.add_task(save_posts_in_background, response)
 
-        tasks = [process_post_on_redis(post, likes) for post, likes in posts]
-        response = await asyncio.gather(*tasks)
-        return response
+        next_cursor = None
+        if keyset and has_next:
+            next_cursor = encode_cursor(posts[-1].createdAt, posts[-1].id)
+        return page_response(response, next_cursor)
 
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except HTTPException as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=e)
 
+# Get many posts by ID: ?ids=a&ids=b or ?ids=a,b
+# One JSON.MGET for all ids, one IN query for the misses, one pipeline to cache them.
+# Posts are returned in request order, unknown ids are left out.
+@router.get("/batch", response_model=List[schemas.PostOut])
+async def get_posts_batch(ids: List[str] = Query(...),
+                          db: AsyncSession = Depends(oauth2.get_read_db),
+                          r: redis.Redis = Depends(get_redis),
+                          current_user: models.User = Depends(oauth2.get_current_user)):
+    ids = list(dict.fromkeys(id for value in ids for id in value.split(",") if id))
+    if len(ids) > MAX_BATCH_IDS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"At most {MAX_BATCH_IDS} ids per request")
+
+    posts = await get_cached_posts(r, ids)
+    missing = [id for id in ids if id not in posts]
+    if missing:
+        rows = (await db.execute(select(models.Post).where(models.posts_by_id(*missing)))).scalars().all()
+        post_outs = [build_post_out(post, post.like_count) for post in rows]
+
+        # Posts still in the write-behind queue aren't in the DB yet
+        found = {post.id for post in rows}
+        pending = await get_pending_posts_raw(r, [id for id in missing if id not in found])
+        for value in pending.values():
+            pending_post = json.loads(value)
+            if not is_tombstone(pending_post):
+                post_outs.append(schemas.PostOut(**pending_post, likes=0))
+
+        await save_posts_to_redis(r, post_outs)
+        posts.update({post_out.id: post_out for post_out in post_outs})
+
+    return posts_response([posts[id] for id in ids if id in posts])
+
+async def load_post(db: AsyncSession, id: str):
+    query = select(models.Post).filter(models.posts_by_id(id))
+    post = (await db.execute(query)).scalars().first()
+    return build_post_out(post, post.like_count) if post else None
+
+# Early refresh of a hot post after the response is sent: reload it and replace the cached doc
+async def refresh_post_cache(id: str):
+    await fill_post_cache(id, lambda db: load_post(db, id), refresh=True)
+
 # Get post by ID
 @router.get("/{id}", response_model=schemas.PostOut)
-async def get_post(id: str, db: Session = Depends(get_db),
+async def get_post(id: str,
+                   background_tasks: BackgroundTasks,
+                   r: redis.Redis = Depends(get_redis),
                    current_user: models.User = Depends(oauth2.get_current_user)):
     try:
-        async with redis_session() as r:
-            cached_post = r.json().get(f"post:{id}")
-            if cached_post:
-                print("Read from cache")
-                return cached_post  # Return if found
-
-        # Fetch post from DB
-        result = db.query(models.Post, func.count(models.Likes.post_id).label("likes"))\
-            .join(models.Likes, models.Likes.post_id == models.Post.id, isouter=True)\
-            .group_by(models.Post.id)\
-            .filter(models.Post.id == id)\
-            .first()  # Execute query
-
-        if not result:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"post with id {id} not found")
+        # Hottest posts are served from this worker's memory
+        local_post = post_l1.get(id)
+        record_cache("post", local_post is not None, tier="l1")
+        if local_post is not None:
+            return post_response(local_post)
+
+        async with r.pipeline(transaction=False) as pipe:
+            pipe.json().get(f"post:{id}")
+            pipe.pttl(f"post:{id}")
+            cached_post, pttl = await pipe.execute()
+        await record_cache_access(r, id, hit=bool(cached_post))
+        if cached_post:
+            if should_refresh_early(pttl):
+                background_tasks.add_task(refresh_post_cache, id)
+            post_l1.set(id, cached_post)
+            return post_response(cached_post)  # Return if found
+
+        # Posts still in the write-behind queue aren't in the DB yet
+        pending = await get_pending_post(r, id)
+        if pending:
+            if is_tombstone(pending):
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"post with id {id} not found")
+            post_out = schemas.PostOut(**pending, likes=0)
+            await save_posts_to_redis(r, [post_out])
+            return post_response(post_out)
 
-        post, likes = result  # Unpacking the result correctly
+        # Fetch post from DB, one load per post however many requests missed it
+        post_out = await fill_post_cache(id, lambda db: load_post(db, id))
+
+        if not post_out:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"post with id {id} not found")
 
-        # Save searched data to Redis and return response
-        post_out = await process_post_on_redis(post, likes)
-        print("Read from db")
-        return post_out
+        post_l1.set(id, post_out)
+        return post_response(post_out)
 
     except HTTPException:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"post with id {id} not found")
@@ -106,27 +232,40 @@ async def get_post(id: str, db: Session = Depends(get_db),
 # Delete Post with ID
 @router.delete("/{id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_post(id: str,
-                      db: Session = Depends(get_db),
+                      db: AsyncSession = Depends(get_db),
+                      r: redis.Redis = Depends(get_redis),
                       current_user: models.User = Depends(oauth2.get_current_user)):
     try:
-        query = db.query(models.Post).filter(models.Post.id == id)
-        post = query.first()
-        if not post:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
-        if post.owner_id != current_user.id:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+        # A pending post is deleted by tombstoning it, the consumer then skips it
+        pending = await get_pending_post(r, id)
+        if pending:
+            if is_tombstone(pending):
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+            if pending["owner_id"] != current_user.id:
+                raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+            await mark_pending_deleted(r, id)
+        else:
+            query = select(models.Post).filter(models.posts_by_id(id))
+            post = (await db.execute(query)).scalars().first()
+            if not post:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+            if post.owner_id != current_user.id:
+                raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
 
-        query.delete(synchronize_session=False)
+        # No-op if the consumer hasn't persisted a pending post yet
+        await db.execute(delete(models.Post).where(models.posts_by_id(id)))
+        # likes_2 has no foreign key to cascade from
+        await db.execute(delete(models.Likes).where(models.Likes.post_id == id))
 
         # Delete from cache if present
-        async with redis_session() as r:
-            r.delete(f"post:{id}")
+        await delete_post_from_redis(r, id)
 
-        db.commit()
+        await db.commit()
+        await oauth2.mark_primary_sticky(r, current_user.id)
         return {f"Message": f"Post with id {id} successfully deleted!"}
 
     except HTTPException as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"post with id {id} couldn't be deleted with error: {e}")
 
 
@@ -134,33 +273,59 @@ async def delete_post(id: str,
 @router.put("/{id}")
 async def update_post(id: str,
                       post: schemas.PostBase,
-                      db: Session = Depends(get_db),
+                      db: AsyncSession = Depends(get_db),
+                      r: redis.Redis = Depends(get_redis),
                       current_user: models.User = Depends(oauth2.get_current_user)):
     try:
-        query = db.query(models.Post).filter(models.Post.id == id)
-        existing_post = query.first()
+        # A pending post is updated in place, the consumer persists its latest version
+        pending = await get_pending_post(r, id)
+        if pending:
+            if is_tombstone(pending):
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Post with id {id} not found")
+            elif pending["owner_id"] != current_user.id:
+                raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+
+            changes = {key: value for key, value in post.model_dump(exclude_unset=True).items() if key in EDITABLE_FIELDS}
+            pending.update(changes)
+            # If the consumer persisted and cleared it meanwhile, the DB row is updated below instead
+            if await save_pending_post(r, pending, xx=True):
+                # No-op if the consumer hasn't persisted it yet
+                if changes:
+                    await db.execute(update(models.Post).where(models.posts_by_id(id)).values(**changes))
+                    await db.commit()
+
+                cached_post = await r.json().get(f"post:{id}")
+                likes = cached_post["likes"] if cached_post else 0
+                post_out = await process_post_on_redis(r, schemas.PostOut(**pending, likes=likes), likes)
+                await invalidate_post(r, id)
+                await oauth2.mark_primary_sticky(r, current_user.id)
+                return post_out
+
+        query = select(models.Post).filter(models.posts_by_id(id))
+        existing_post = (await db.execute(query)).scalars().first()
         if not existing_post:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Post with id {id} not found")
         elif existing_post.owner_id != current_user.id:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
 
-        update_data = post.model_dump(exclude_unset=True)
-        for key, value in update_data.items():
-            if key != "id":
-                setattr(existing_post, key, value)
+        # Never id, owner_id or createdAt: createdAt is in the primary key and picks the partition
+        changes = {key: value for key, value in post.model_dump(exclude_unset=True).items() if key in EDITABLE_FIELDS}
+        for key, value in changes.items():
+            setattr(existing_post, key, value)
 
         # Update cache
-        async with redis_session() as r:
-            cached_post = r.json().get(f"post:{id}")
-            likes = cached_post["likes"] if cached_post else 0
+        cached_post = await r.json().get(f"post:{id}")
+        likes = cached_post["likes"] if cached_post else existing_post.like_count
 
-        await process_post_on_redis(existing_post, likes)
+        await process_post_on_redis(r, existing_post, likes)
+        await invalidate_post(r, id)
 
-        db.commit()
-        db.refresh(existing_post)
+        await db.commit()
+        await db.refresh(existing_post)
+        await oauth2.mark_primary_sticky(r, current_user.id)
         return existing_post
 
     except HTTPException as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail=f"post with id {id} couldn't be updated with error: {e}")
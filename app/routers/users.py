@@ -1,37 +1,41 @@
 
 from fastapi import status, HTTPException, Depends, APIRouter
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 from ..database import get_db
-from .. import models, schemas
+from .. import models, schemas, oauth2
 from .. import utils
 router = APIRouter(prefix="/users", tags = ["users"])
 
 @router.post("/", status_code = status.HTTP_201_CREATED, response_model=schemas.UserGet)
-async def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    # password hash
-    user.password = utils.hash(user.password)
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
+    # password hash, on the bcrypt pool
+    try:
+        user.password = await utils.hash_async(user.password)
+    except utils.PasswordHashBusy as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e), headers={"Retry-After": "1"})
 
     new_user = models.User(**user.model_dump())
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     return new_user
 
 @router.get('/', response_model=List[schemas.UserGet])
-async def get_users(db: Session = Depends(get_db)):
+async def get_users(db: AsyncSession = Depends(oauth2.get_read_db)):
     try:
-        query = db.query(models.User)
-        users = query.all()
+        query = select(models.User)
+        users = (await db.execute(query)).scalars().all()
         return users
     except HTTPException as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=e)
 
 
 @router.get('/{id}', response_model=schemas.UserGet)
-async def get_user(id: int, db: Session = Depends(get_db)):
-    query = db.query(models.User).filter(models.User.id == id)
-    user = query.first()
+async def get_user(id: int, db: AsyncSession = Depends(oauth2.get_read_db)):
+    query = select(models.User).filter(models.User.id == id)
+    user = (await db.execute(query)).scalars().first()
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"User with id: {id} not available!")
     return user
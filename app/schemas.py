@@ -1,7 +1,7 @@
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel, EmailStr, Field
-from .utils import generate_base62_id
+from .utils import generate_post_id, post_id_time
 # Pydantic Models
 # Used for Request & Response validations
 
@@ -18,8 +18,11 @@ class PostBase(BaseModel):
 class PostCreate(PostBase):
 
     def __init__(self, **data):
-        if 'id' not in data or data['id'] is None:
-            data['id'] = generate_base62_id()
+        # Always assigned here, whatever the client sent: posts_2 only enforces (id, createdAt)
+        # as unique, and lookups by id find the partition from the time in the id
+        data['id'] = generate_post_id()
+        # Same instant as the id, so ordering by createdAt or by id agrees
+        data['createdAt'] = post_id_time(data['id'])
         super().__init__(**data)
     # createdAt field is not included in PostCreate because it is automatically generated by the database
     title: str
@@ -29,6 +32,7 @@ class PostCreate(PostBase):
 class UserCreate(BaseModel):
     id: Optional[int] = None
     email: EmailStr
+    password: str
     createdAt: Optional[datetime] = None
 
 class UserGet(BaseModel):
@@ -51,6 +55,9 @@ class TokenData(BaseModel):
 class Like(BaseModel):
     post_id: str
 
+class Follow(BaseModel):
+    user_id: int
+
 class Post(PostBase):
     id: str
     createdAt: datetime
@@ -71,3 +78,9 @@ class PostOut(BaseModel):
     class Config:
         from_attributes = True
 
+
+class PostPage(BaseModel):
+    posts: List[PostOut]
+    next_cursor: Optional[str] = None
+    # Tier that served the page: "redis" or "postgres"
+    source: str = "postgres"
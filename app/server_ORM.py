@@ -1,26 +1,68 @@
-from fastapi import FastAPI
-from . import models
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, Response
+import redis.asyncio as redis
 from .schemas import *
-from .database import engine
-from .routers import posts, users, auth, likes
-from .redis_cache import init_redis
+from .database import async_engine, replicas
+from .routers import posts, users, auth, likes, follows, feed
+from .redis_cache import init_redis, init_redis_pool, close_redis_pool, get_redis, get_cache_stats, \
+    listen_for_invalidations, claim_post_id_worker
+from .kafka.kafka_init import Kafka
+from . import metrics, migrations
 
-# Initialize FastAPI Server
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Apply pending schema migrations (app/migrations) and keep future posts_2 partitions created
+    await asyncio.to_thread(migrations.migrate)
+    partitions = asyncio.create_task(migrations.maintain_post_partitions())
+
+    # Open the shared Redis connection pool and initialize Redis Index Schemas
+    init_redis_pool()
+    await init_redis()
+    # Distinct worker id for the post ids this process generates
+    await claim_post_id_worker()
+    # Keep this worker's L1 post cache in sync with writes on other workers
+    invalidations = asyncio.create_task(listen_for_invalidations())
+    # Keep lagging or unreachable read replicas out of rotation
+    replica_monitor = asyncio.create_task(replicas.monitor()) if replicas.engines else None
 
-# Initialize SQLAlchemy DB models
-models.Base.metadata.create_all(bind=engine)
+    # Serve Kafka producer delivery reports in the background
+    kafka = Kafka()
+    kafka.start_polling()
+    yield
+    invalidations.cancel()
+    partitions.cancel()
+    if replica_monitor:
+        replica_monitor.cancel()
+    kafka.close()
+    await close_redis_pool()
+    await async_engine.dispose()
+    await replicas.dispose()
 
-# Initialize Redis Index Schemas
-init_redis()
+# Initialize FastAPI Server
+app = FastAPI(lifespan=lifespan)
+# Request latency, status and SQL usage per route for /metrics
+app.add_middleware(metrics.MetricsMiddleware)
 
 # Link routers for all paths
 app.include_router(posts.router)
 app.include_router(users.router)
 app.include_router(auth.router)
 app.include_router(likes.router)
+app.include_router(follows.router)
+app.include_router(feed.router)
 
 # Path
 @app.get("/")
 async def read_root():
     return {"Hello": "World"}
+
+# Post cache hit/miss/eviction counters, Redis tier and this worker's L1
+@app.get("/cache/stats")
+async def cache_stats(r: redis.Redis = Depends(get_redis)):
+    return await get_cache_stats(r)
+
+# Prometheus scrape endpoint
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
@@ -0,0 +1,36 @@
+import pytest
+import redis.asyncio as redis
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import create_async_engine
+from .. import models, redis_cache
+
+# SQLite session with the app's tables, through the benchmark stand-ins (benchmarks/requirements.txt)
+@pytest.fixture
+def db():
+    standins = pytest.importorskip("benchmarks.standins")
+    engine = create_engine("sqlite://").execution_options(schema_translate_map=standins.SCHEMA_MAP)
+    event.listen(engine, "connect", standins.register_sqlite_functions)
+    models.Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+# Async (aiosqlite) engine over a file, for the routers' AsyncSession code.
+# Use and dispose of it inside the test's event loop, aiosqlite's worker thread keeps the process alive otherwise
+@pytest.fixture
+def async_engine(tmp_path):
+    standins = pytest.importorskip("benchmarks.standins")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/test.db")\
+        .execution_options(schema_translate_map=standins.SCHEMA_MAP)
+    event.listen(engine.sync_engine, "connect", standins.register_sqlite_functions)
+    return engine
+
+# fakeredis behind redis_cache.redis_pool, so get_redis/redis_session use it
+@pytest.fixture
+def fake_redis(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    pool = redis.ConnectionPool(connection_class=fakeredis.FakeAsyncConnection, server=fakeredis.FakeServer(),
+                                decode_responses=True)
+    monkeypatch.setattr(redis_cache, "redis_pool", pool)
+    return pool
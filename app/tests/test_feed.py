@@ -0,0 +1,38 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from .. import models
+from ..redis_cache import redis_session
+from ..feed import feed_key, read_feed, remove_following
+
+# User 1 follows user 2, their feed still holds user 3's newer posts and a deleted post
+def test_feed_pages_skip_unfollowed_and_deleted_posts(async_engine, fake_redis):
+    start = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(minutes=10)
+    posts = [models.Post(id=f"{owner}{i}", title="t", content="c", published=True, owner_id=owner, like_count=0,
+                         createdAt=start + timedelta(seconds=10 * i + owner)) for owner in (2, 3) for i in range(4)]
+    scores = {post.id: post.createdAt.timestamp() for post in posts}
+    scores["gone"] = max(scores.values()) + 1
+
+    async def run():
+        try:
+            async with async_engine.begin() as conn:
+                await conn.run_sync(models.Base.metadata.create_all)
+            async with async_sessionmaker(async_engine)() as db:
+                db.add_all(posts + [models.Follow(follower_id=1, followee_id=2)])
+                await db.commit()
+                async with redis_session() as r:
+                    await r.zadd(feed_key(1), scores)
+                    page, _ = await read_feed(r, db, 1, limit=2)
+                    ids = [post["id"] for _, post in page]
+
+                    # Unfollowing takes the followee's posts out of the feed
+                    await remove_following(r, db, 1, 2)
+                    left = await r.zrange(feed_key(1), 0, -1)
+        finally:
+            await async_engine.dispose()
+        return ids, left
+
+    ids, left = asyncio.run(run())
+    # limit + 1 posts, though the newest feed entries are all filtered out
+    assert ids == ["23", "22", "21"]
+    assert sorted(left) == ["30", "31", "32", "33", "gone"]
@@ -0,0 +1,89 @@
+import asyncio
+import json
+import pytest
+from datetime import datetime, timezone
+from sqlalchemy import select, text
+from .. import models
+from ..redis_cache import redis_session, save_pending_post
+from ..kafka.kafka_processing import parse_like_event, coalesce_likes, split_missing_posts, save_likes_batch, \
+    like_commit_offsets
+
+def like(post_id, user_id, action="like"):
+    return {"post_id": post_id, "user_id": user_id, "action": action}
+
+def add_post(db, post_id):
+    db.add(models.Post(id=post_id, title="t", content="c", owner_id=1, createdAt=datetime.now(timezone.utc)))
+    db.commit()
+
+def test_parse_like_event_rejects_malformed_messages():
+    assert parse_like_event(b'{"post_id": "p", "user_id": "3", "action": "unlike"}') == like("p", 3, "unlike")
+    for value in (b"{not json", b'"like"', b'{"post_id": "p", "user_id": 1, "action": "love"}',
+                  b'{"post_id": "p", "action": "like"}', b'{"user_id": 1, "action": "like"}', b"\xff"):
+        with pytest.raises((ValueError, TypeError, KeyError)):
+            parse_like_event(value)
+
+def test_coalesce_likes_keeps_the_last_event_per_user():
+    likes, unlikes = coalesce_likes([like("a", 1), like("a", 1, "unlike"), like("a", 2, "unlike"), like("a", 2),
+                                     like("b", 1), like("b", 1, "unlike"), like("b", 1)])
+    assert sorted(likes) == [("a", 2), ("b", 1)]
+    assert unlikes == [("a", 1)]
+
+def test_split_missing_posts(db):
+    add_post(db, "a")
+    likes, unlikes, missing = split_missing_posts([("a", 1), ("b", 1)], [("b", 2)], db)
+    assert (likes, unlikes) == ([("a", 1)], [])
+    assert missing == {("b", 1): "like", ("b", 2): "unlike"}
+
+# A like of a post still in the write-behind queue is held back, a later unlike replaces it
+def test_held_like_is_replaced_by_a_later_unlike(db, fake_redis):
+    async def run():
+        async with redis_session() as r:
+            await save_pending_post(r, {"id": "p", "title": "t", "content": "c", "owner_id": 1})
+        held, _ = await save_likes_batch([(like("p", 1), ("likes", 0, 10)), (like("gone", 1), ("likes", 0, 11))],
+                                         {}, db)
+        assert held == {("p", 1): ("like", ("likes", 0, 10))}
+
+        held, _ = await save_likes_batch([(like("p", 1, "unlike"), ("likes", 0, 12))], held, db)
+        assert held == {("p", 1): ("unlike", ("likes", 0, 10))}
+
+        # Once the post is persisted the final state is applied
+        add_post(db, "p")
+        return await save_likes_batch([], held, db)
+
+    assert asyncio.run(run()) == ({}, 0)
+    assert db.execute(select(models.Likes)).all() == []
+    assert db.execute(select(models.Post.like_count)).scalar() == 0
+
+# An event the DB rejects (here a user missing from users_2) is dead-lettered, the rest of the batch applies
+def test_rejected_like_is_dead_lettered(db, fake_redis):
+    class Producer:
+        def __init__(self):
+            self.sent = []
+        def produce(self, topic, key=None, value=None, headers=None, on_delivery=None):
+            self.sent.append((topic, json.loads(value), headers["offset"]))
+
+    db.execute(text("PRAGMA foreign_keys = ON"))
+    db.add(models.User(id=1, email="a@example.com", password="x"))
+    db.commit()
+    add_post(db, "p")
+    producer = Producer()
+    held, dead_letters = asyncio.run(save_likes_batch([(like("p", 1), ("likes", 0, 5)), (like("p", 2), ("likes", 0, 6))],
+                                                      {}, db, producer))
+    assert (held, dead_letters) == ({}, 1)
+    assert producer.sent == [("likes-dlq", like("p", 2), "6")]
+    assert db.execute(select(models.Likes.user_id)).scalars().all() == [1]
+    assert db.execute(select(models.Post.like_count)).scalar() == 1
+
+def test_commit_stops_at_the_oldest_held_event():
+    class Msg:
+        def __init__(self, partition, offset):
+            self._partition, self._offset = partition, offset
+        def topic(self):
+            return "likes"
+        def partition(self):
+            return self._partition
+        def offset(self):
+            return self._offset
+
+    offsets = like_commit_offsets([Msg(0, 20), Msg(0, 21), Msg(1, 7)], {("p", 1): ("like", ("likes", 0, 10))})
+    assert sorted((tp.partition, tp.offset) for tp in offsets) == [(0, 10), (1, 8)]
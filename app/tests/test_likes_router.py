@@ -0,0 +1,24 @@
+import asyncio
+import pytest
+from types import SimpleNamespace
+from fastapi import HTTPException
+from ..redis_cache import redis_session, save_likers, likers_key
+from ..routers import likes
+from .. import schemas
+
+class FailingProducer:
+    def produce(self, *args, **kwargs):
+        raise RuntimeError("broker unreachable")
+
+# An unlike that can't be written behind leaves the like in Redis, as likes_2 still has it
+def test_unvote_keeps_the_like_when_the_write_fails(fake_redis, monkeypatch):
+    monkeypatch.setattr(likes, "Kafka", lambda: SimpleNamespace(producer=FailingProducer()))
+
+    async def run():
+        async with redis_session() as r:
+            await save_likers(r, "p", [1])
+            with pytest.raises(HTTPException) as error:
+                await likes.unvote(schemas.Like(post_id="p"), None, r, SimpleNamespace(id=1))
+            return error.value.status_code, await r.sismember(likers_key("p"), 1)
+
+    assert asyncio.run(run()) == (503, True)
@@ -0,0 +1,54 @@
+import asyncio
+from .. import metrics
+from ..metrics import Counter, Histogram, REGISTRY, MetricsMiddleware, request_db_usage
+
+def test_counter_and_histogram_rendering():
+    counter = Counter("test_events_total", "Test events", ("kind",))
+    histogram = Histogram("test_latency_seconds", "Test latency", ("kind",), buckets=(0.1, 1.0))
+    try:
+        counter.inc(kind="a")
+        counter.inc(2, kind="a")
+        histogram.observe(0.1, kind="a")
+        histogram.observe(5, kind="a")
+
+        assert counter.render()[2] == 'test_events_total{kind="a"} 3'
+        assert histogram.render()[2:] == [
+            'test_latency_seconds_bucket{kind="a",le="0.1"} 1',
+            'test_latency_seconds_bucket{kind="a",le="1.0"} 1',
+            'test_latency_seconds_bucket{kind="a",le="+Inf"} 2',
+            'test_latency_seconds_sum{kind="a"} 5.1',
+            'test_latency_seconds_count{kind="a"} 2',
+        ]
+    finally:
+        REGISTRY.remove(counter)
+        REGISTRY.remove(histogram)
+
+class Recorder:
+    def __init__(self):
+        self.values = []
+
+    def observe(self, value, **labels):
+        self.values.append(value)
+
+# Work after the response is sent (BackgroundTasks) counts toward neither latency nor SQL
+def test_middleware_stops_at_the_last_body_chunk(monkeypatch):
+    recorders = {name: Recorder() for name in ("http_request_duration", "http_request_statements",
+                                               "http_request_db_time")}
+    for name, recorder in recorders.items():
+        monkeypatch.setattr(metrics, name, recorder)
+
+    async def app(scope, receive, send):
+        request_db_usage.get()[0] += 1
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"a", "more_body": True})
+        await send({"type": "http.response.body", "body": b"b"})
+        # Background task
+        request_db_usage.get()[0] += 5
+        await asyncio.sleep(0.2)
+
+    async def send(message):
+        pass
+
+    asyncio.run(MetricsMiddleware(app)({"type": "http", "method": "GET"}, None, send))
+    assert recorders["http_request_duration"].values[0] < 0.2
+    assert recorders["http_request_statements"].values == [1]
@@ -0,0 +1,8 @@
+import os
+from ..migrations import MIGRATIONS_DIR, migration_files
+
+def test_migration_versions_are_unique_and_contiguous():
+    files = migration_files()
+    assert [version for version, _ in files] == list(range(1, len(files) + 1))
+    # Every .sql file in the directory is picked up
+    assert len(files) == len([name for name in os.listdir(MIGRATIONS_DIR) if name.endswith(".sql")])
@@ -0,0 +1,102 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from .. import schemas, redis_cache
+from ..redis_cache import redis_session, save_posts_to_redis, save_post_to_redis, fill_post_cache, \
+    FILL_LOCK_PREFIX, RELEASE_LOCK_SCRIPT, save_likers, add_liker, update_like_count
+
+def post_out(title, likes):
+    return schemas.PostOut(id="a", title=title, content="c", published=True, owner_id=1,
+                           createdAt=datetime.now(timezone.utc), likes=likes)
+
+# A fill from a DB row that lags the cache doesn't replace it, a write does
+def test_read_fills_dont_overwrite_cached_posts(fake_redis):
+    async def run():
+        async with redis_session() as r:
+            await save_post_to_redis(r, post_out("t", 5))
+            await save_posts_to_redis(r, [post_out("t", 0)])
+            filled = await r.json().get("post:a")
+            await save_post_to_redis(r, post_out("edited", 5))
+            return filled, await r.json().get("post:a")
+
+    filled, written = asyncio.run(run())
+    assert filled["likes"] == 5
+    assert written["title"] == "edited"
+
+# Likes not yet in the DB's like_count aren't lost when the post is (re)filled from the DB
+def test_cached_likes_follow_the_likers_set(fake_redis):
+    async def run():
+        async with redis_session() as r:
+            await save_likers(r, "a", [1, 2])
+            # Liked while not cached, then filled from a row that doesn't count it yet
+            await add_liker(r, "a", 3)
+            await update_like_count(r, "a")
+            await save_posts_to_redis(r, [post_out("t", 2)])
+            filled = (await r.json().get("post:a"))["likes"]
+            await add_liker(r, "a", 4)
+            await update_like_count(r, "a")
+            return filled, (await r.json().get("post:a"))["likes"]
+
+    assert asyncio.run(run()) == (3, 4)
+
+# Concurrent misses share one load, on the fill's own session, and the lease is released after it
+def test_fill_post_cache_loads_once_on_its_own_session(fake_redis, monkeypatch):
+    sessions = []
+
+    @asynccontextmanager
+    async def read_session(primary=False):
+        sessions.append(object())
+        yield sessions[-1]
+
+    monkeypatch.setattr(redis_cache, "read_session", read_session)
+    loads = []
+
+    async def load(db):
+        loads.append(db)
+        await asyncio.sleep(0.01)
+        return post_out("t", 0)
+
+    async def run():
+        results = await asyncio.gather(*(fill_post_cache("a", load) for _ in range(5)))
+        async with redis_session() as r:
+            return results, await r.exists(FILL_LOCK_PREFIX + "a"), await r.json().get("post:a")
+
+    results, locked, cached = asyncio.run(run())
+    assert loads == sessions and len(loads) == 1
+    assert {result.title for result in results} == {"t"}
+    assert not locked and cached["title"] == "t"
+
+# An early refresh recomputes the cached doc from the primary, the likes still come from the likers set
+def test_refresh_replaces_the_cached_doc(fake_redis, monkeypatch):
+    sessions = []
+
+    @asynccontextmanager
+    async def read_session(primary=False):
+        sessions.append(primary)
+        yield None
+
+    monkeypatch.setattr(redis_cache, "read_session", read_session)
+
+    async def load(db):
+        return post_out("edited", 0)
+
+    async def run():
+        async with redis_session() as r:
+            await save_likers(r, "a", [1])
+            await save_post_to_redis(r, post_out("t", 1))
+            await fill_post_cache("a", load, refresh=True)
+            return await r.json().get("post:a")
+
+    cached = asyncio.run(run())
+    assert (cached["title"], cached["likes"]) == ("edited", 1)
+    assert sessions == [True]
+
+def test_release_lock_script_keeps_a_lock_taken_over(fake_redis):
+    async def run():
+        async with redis_session() as r:
+            await r.set("lock", "theirs")
+            kept = await r.eval(RELEASE_LOCK_SCRIPT, 1, "lock", "mine")
+            released = await r.eval(RELEASE_LOCK_SCRIPT, 1, "lock", "theirs")
+            return kept, released, await r.exists("lock")
+
+    assert asyncio.run(run()) == (0, 1, 0)
@@ -0,0 +1,52 @@
+import asyncio
+import pytest
+import redis.asyncio as redis
+from datetime import datetime, timedelta, timezone
+from fastapi import BackgroundTasks
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from .. import models
+from ..redis_cache import redis_session, save_posts_to_redis, build_post_out, COVERAGE_KEY
+from ..routers.posts import get_posts
+
+# Newest-first pages through GET /posts: Redis answers while the page is inside the coverage
+# watermark, the DB answers past it, and the cursor carries over between the two
+def test_pages_past_the_coverage_watermark_come_from_the_db(async_engine, fake_redis, monkeypatch):
+    standins = pytest.importorskip("benchmarks.standins")
+    monkeypatch.setattr(redis.Redis, "ft", lambda self, index_name="idx": standins.SearchIndexStandIn(self))
+
+    start = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(minutes=10)
+    posts = [models.Post(id=f"p{i:02}", title="t", content="c", published=True, owner_id=1, like_count=0,
+                         createdAt=start + timedelta(seconds=i)) for i in range(10)]
+    # Only the newest six are cached, and the cache vouches for everything since p04
+    cached = [build_post_out(post, 0) for post in posts[4:]]
+
+    async def run():
+        try:
+            async with async_engine.begin() as conn:
+                await conn.run_sync(models.Base.metadata.create_all)
+            async with async_sessionmaker(async_engine)() as db:
+                db.add_all(posts)
+                await db.commit()
+                async with redis_session() as r:
+                    await save_posts_to_redis(r, cached)
+                    await r.set(COVERAGE_KEY, cached[0].createdAt.timestamp())
+
+                    pages, cursor = [], None
+                    while True:
+                        page = await get_posts(BackgroundTasks(), db, r, None, limit=3, sortBy="createdAt",
+                                               sortAsc=False, search="", cursor=cursor)
+                        pages.append((page.source, [post.id for post in page.posts]))
+                        cursor = page.next_cursor
+                        if cursor is None:
+                            break
+        finally:
+            await async_engine.dispose()
+        return pages
+
+    assert asyncio.run(run()) == [
+        ("redis", ["p09", "p08", "p07"]),
+        # p04 is covered, but looking one row past the page reaches p03, which isn't
+        ("postgres", ["p06", "p05", "p04"]),
+        ("postgres", ["p03", "p02", "p01"]),
+        ("postgres", ["p00"]),
+    ]
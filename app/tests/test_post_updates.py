@@ -0,0 +1,31 @@
+import asyncio
+from types import SimpleNamespace
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from .. import models, schemas
+from ..redis_cache import redis_session
+from ..routers.posts import update_post
+from ..utils import generate_post_id, post_id_time
+
+# Only the editable fields change, the row stays in its partition and with its owner
+def test_update_post_keeps_created_at_and_owner(async_engine, fake_redis):
+    id = generate_post_id()
+
+    async def run():
+        try:
+            async with async_engine.begin() as conn:
+                await conn.run_sync(models.Base.metadata.create_all)
+            async with async_sessionmaker(async_engine)() as db:
+                db.add(models.Post(id=id, title="t", content="c", owner_id=5, createdAt=post_id_time(id)))
+                await db.commit()
+                async with redis_session() as r:
+                    changes = schemas.PostBase(title="edited", createdAt="2020-01-01T00:00:00Z", owner_id=True)
+                    await update_post(id, changes, db, r, SimpleNamespace(id=5))
+                row = (await db.execute(select(models.Post).where(models.posts_by_id(id)))).scalars().one()
+                return row.title, row.owner_id, row.createdAt
+        finally:
+            await async_engine.dispose()
+
+    title, owner_id, created_at = asyncio.run(run())
+    assert (title, owner_id) == ("edited", 5)
+    assert created_at.replace(tzinfo=None) == post_id_time(id).replace(tzinfo=None)
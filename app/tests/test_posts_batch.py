@@ -0,0 +1,51 @@
+import asyncio
+import pytest
+from datetime import datetime, timedelta, timezone
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from .. import models
+from ..redis_cache import redis_session, save_posts_to_redis, build_post_out, save_pending_post, \
+    mark_pending_deleted
+from ..routers.posts import get_posts_batch, MAX_BATCH_IDS
+
+def post_id(post):
+    return post["id"] if isinstance(post, dict) else post.id
+
+# a and b are in the DB, c only in Redis, d is pending, e was deleted while pending
+def test_batch_returns_posts_in_request_order(async_engine, fake_redis):
+    now = datetime.now(timezone.utc)
+    rows = [models.Post(id=id, title="t", content="c", published=True, owner_id=1, like_count=0,
+                        createdAt=now - timedelta(minutes=i)) for i, id in enumerate("abc")]
+    cached = build_post_out(rows[2], 0)
+
+    async def run():
+        try:
+            async with async_engine.begin() as conn:
+                await conn.run_sync(models.Base.metadata.create_all)
+            async with async_sessionmaker(async_engine)() as db:
+                db.add_all(rows[:2])
+                await db.commit()
+                async with redis_session() as r:
+                    await save_posts_to_redis(r, [cached])
+                    for id in "de":
+                        await save_pending_post(r, {"id": id, "title": "t", "content": "c", "published": True,
+                                                    "owner_id": 1, "createdAt": now.isoformat()})
+                    await mark_pending_deleted(r, "e")
+
+                    posts = await get_posts_batch(["c,a", "d", "a", "e", "zz", "b"], db, r, None)
+                    # The misses were cached on the way
+                    refilled = await get_posts_batch(["a", "d"], None, r, None)
+                    return [post_id(post) for post in posts], [post_id(post) for post in refilled]
+        finally:
+            await async_engine.dispose()
+
+    assert asyncio.run(run()) == (["c", "a", "d", "b"], ["a", "d"])
+
+def test_batch_rejects_too_many_ids(fake_redis):
+    async def run():
+        async with redis_session() as r:
+            await get_posts_batch([",".join(f"p{i}" for i in range(MAX_BATCH_IDS + 1))], None, r, None)
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(run())
+    assert error.value.status_code == 400
@@ -0,0 +1,83 @@
+import asyncio
+import json
+import pytest
+import threading
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from ..redis_cache import redis_session, save_pending_post, get_pending_post, mark_pending_deleted, \
+    get_pending_posts_raw, clear_pending_posts, is_tombstone, PENDING_TOMBSTONE, save_post_to_redis, build_post_out
+from ..kafka.kafka_processing import apply_pending, build_post_row, write_post
+
+def post(id, **fields):
+    return {"id": id, "title": "t", "content": "c", "published": True, "owner_id": 1, **fields}
+
+def test_build_post_row():
+    row = build_post_row(json.dumps({**post("a"), "createdAt": "2026-10-18T10:00:00+00:00", "likes": 3}))
+    assert row == {**post("a"), "createdAt": datetime(2026, 10, 18, 10, tzinfo=timezone.utc)}
+    # Older messages left the owner out of the value and keyed it "{owner_id}_{time}"
+    legacy = {key: value for key, value in post("a").items() if key != "owner_id"}
+    assert build_post_row(json.dumps(legacy), "7_1760781600")["owner_id"] == 7
+
+def test_build_post_row_rejects_malformed_messages():
+    for value in ("{not json", json.dumps({**post("a"), "id": ""}), json.dumps({"title": "t", "owner_id": 1}),
+                  json.dumps({"id": "a", "title": "t"}), json.dumps({**post("a"), "createdAt": "yesterday"})):
+        with pytest.raises(ValueError):
+            build_post_row(value)
+
+def test_is_tombstone():
+    assert is_tombstone(dict(PENDING_TOMBSTONE))
+    assert not is_tombstone(post("a"))
+
+# Edits made while the post was queued are persisted, deleted posts are dropped
+def test_apply_pending_overlays_edits_and_drops_deletes():
+    rows = [post("a"), post("b"), post("c")]
+    pending = {"a": json.dumps(post("a", title="edited", owner_id=2)), "b": json.dumps(PENDING_TOMBSTONE)}
+    assert apply_pending(rows, pending) == [post("a", title="edited"), post("c")]
+
+def test_clear_pending_posts_keeps_posts_changed_since_they_were_read(fake_redis):
+    async def run():
+        async with redis_session() as r:
+            await save_pending_post(r, post("a"))
+            await save_pending_post(r, post("b"))
+            read = await get_pending_posts_raw(r, ["a", "b"])
+            # Deleted after the consumer read it
+            await mark_pending_deleted(r, "b")
+            changed = await clear_pending_posts(r, read)
+            return changed, await get_pending_post(r, "a"), await get_pending_post(r, "b")
+
+    assert asyncio.run(run()) == (["b"], None, PENDING_TOMBSTONE)
+
+# An edit racing the consumer's clear doesn't bring the pending post back
+def test_save_pending_post_xx_only_overwrites_pending_posts(fake_redis):
+    async def run():
+        async with redis_session() as r:
+            saved = await save_pending_post(r, post("a"), xx=True)
+            return saved, await get_pending_post(r, "a")
+
+    assert asyncio.run(run()) == (False, None)
+
+# The broker gave up on the message: the post is dropped instead of being served until the pending entry expires
+def test_undelivered_post_is_discarded(fake_redis):
+    class Msg:
+        def key(self):
+            return b"a"
+        def topic(self):
+            return "posts"
+
+    class Producer:
+        def produce(self, topic, key=None, value=None, on_delivery=None):
+            # Delivery reports come from the producer's poll thread
+            threading.Thread(target=on_delivery, args=("Message timed out", Msg())).start()
+
+    async def run():
+        async with redis_session() as r:
+            await save_pending_post(r, post("a"))
+            await save_post_to_redis(r, build_post_out(SimpleNamespace(**post("a"), createdAt=datetime.now(timezone.utc)), 0))
+            await write_post(Producer(), json.dumps(post("a")), "a")
+            for _ in range(100):
+                await asyncio.sleep(0.01)
+                if not await r.exists("post:a"):
+                    break
+            return await get_pending_post(r, "a"), await r.exists("post:a")
+
+    assert asyncio.run(run()) == (None, 0)
@@ -0,0 +1,109 @@
+import asyncio
+import jwt
+import pytest
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+from fastapi import HTTPException
+from .. import database, models, oauth2
+from ..config import settings
+from ..database import ReplicaSet
+from ..redis_cache import redis_session
+
+def engine(host, checked_out=0):
+    return SimpleNamespace(url=SimpleNamespace(host=host), pool=SimpleNamespace(checkedout=lambda: checked_out))
+
+def test_round_robin_cycles_through_healthy_replicas(monkeypatch):
+    monkeypatch.setattr(settings, "database_replica_balancing", "round_robin")
+    a, b = engine("a"), engine("b")
+    replicas = ReplicaSet([a, b])
+    assert replicas.pick() is None
+    replicas.healthy = [a, b]
+    assert [replicas.pick() for _ in range(4)] == [a, b, a, b]
+
+def test_least_connections_picks_the_idlest_replica(monkeypatch):
+    monkeypatch.setattr(settings, "database_replica_balancing", "least_connections")
+    a, b, c = engine("a", 3), engine("b", 1), engine("c", 2)
+    replicas = ReplicaSet([a, b, c])
+    replicas.healthy = [a, b, c]
+    assert replicas.pick() is b
+
+# Lagging and unreachable replicas leave the rotation and come back once they catch up
+def test_check_rotates_replicas_by_lag(monkeypatch):
+    monkeypatch.setattr(settings, "database_replica_max_lag", 5.0)
+    a, b, c = engine("a"), engine("b"), engine("c")
+    replicas = ReplicaSet([a, b, c])
+    lags = {"a": 0.0, "b": 30.0, "c": None}
+
+    async def replica_lag(engine):
+        return lags[engine.url.host]
+
+    monkeypatch.setattr(replicas, "replica_lag", replica_lag)
+    asyncio.run(replicas.check())
+    assert replicas.healthy == [a]
+
+    lags.update(b=1.0, c=0.0)
+    asyncio.run(replicas.check())
+    assert replicas.healthy == [a, b, c]
+
+@pytest.fixture
+def sessions(monkeypatch):
+    # Records which side each session was opened on, and serves the given users from it
+    opened = []
+    users = {"replica": None, "primary": None}
+
+    class Session:
+        def __init__(self, side):
+            self.side = side
+
+        async def execute(self, query):
+            user = users[self.side]
+            return SimpleNamespace(scalars=lambda: SimpleNamespace(first=lambda: user))
+
+    @asynccontextmanager
+    async def read_session(primary=False):
+        opened.append("primary" if primary else "replica")
+        yield Session(opened[-1])
+
+    monkeypatch.setattr(oauth2, "read_session", read_session)
+    monkeypatch.setattr(database.replicas, "engines", [engine("a")])
+    monkeypatch.setattr(database.replicas, "healthy", [engine("a")])
+    return SimpleNamespace(opened=opened, users=users, Session=Session)
+
+def token(user_id):
+    return jwt.encode({"user_id": user_id}, settings.secret_key, algorithm=settings.algorithm)
+
+# After a write the user reads from the primary, other users keep reading from replicas
+def test_read_db_sticks_to_the_primary_after_a_write(fake_redis, sessions):
+    async def side(r, user_id):
+        generator = oauth2.get_read_db(token(user_id), r)
+        db = await generator.__anext__()
+        await generator.aclose()
+        return db.side
+
+    async def run():
+        async with redis_session() as r:
+            await oauth2.mark_primary_sticky(r, 1)
+            ttl = await r.pttl(oauth2.primary_sticky_key(1))
+            return ttl, await side(r, 1), await side(r, 2)
+
+    ttl, writer, reader = asyncio.run(run())
+    assert 0 < ttl <= settings.database_read_your_writes_window * 1000
+    assert (writer, reader) == ("primary", "replica")
+
+# A user created moments ago may not be on the replica yet
+def test_current_user_falls_back_to_the_primary(fake_redis, sessions, monkeypatch):
+    monkeypatch.setattr(settings, "user_cache_redis", False)
+    oauth2.user_cache.delete(7)
+    sessions.users["primary"] = models.User(id=7, email="new@example.com")
+
+    async def run(user_id):
+        async with redis_session() as r:
+            return await oauth2.get_current_user(token(user_id), sessions.Session("replica"), r)
+
+    assert asyncio.run(run(7)).email == "new@example.com"
+    assert sessions.opened == ["primary"]
+    oauth2.user_cache.delete(7)
+
+    sessions.users["primary"] = None
+    with pytest.raises(HTTPException):
+        asyncio.run(run(8))
@@ -0,0 +1,88 @@
+import asyncio
+import pytest
+import time
+from datetime import datetime, timedelta, timezone
+from fastapi import HTTPException
+from sqlalchemy import select
+from .. import models, schemas, utils
+from ..config import settings
+from ..routers import users
+from ..utils import encode_cursor, decode_cursor, build_tsquery, PostIdGenerator, post_id_time, decode_base62, \
+    POST_ID_LENGTH, post_id_time_range, generate_post_id
+
+def test_cursor_round_trip():
+    created_at = datetime(2025, 2, 14, 9, 30, 15, 123456, tzinfo=timezone.utc)
+    cursor = encode_cursor(created_at, "aB3xYz")
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (created_at, "aB3xYz")
+
+def test_invalid_cursor():
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+def test_build_tsquery():
+    assert build_tsquery("scal red-is") == "scal:* & red:* & is:*"
+    assert build_tsquery("  ") == ""
+    assert build_tsquery("it's a 'quote' & | !") == "it:* & s:* & a:* & quote:*"
+
+def test_post_ids_sort_by_creation_time(monkeypatch):
+    now_ns = [1760000000000 * 1_000_000]
+    monkeypatch.setattr("app.utils.time.time_ns", lambda: now_ns[0])
+    generator = PostIdGenerator(worker_id=7)
+
+    # More ids than one millisecond's sequence holds, then a clock step backwards
+    ids = [generator.next_id() for _ in range(5000)]
+    now_ns[0] -= 5_000_000
+    ids += [generator.next_id() for _ in range(10)]
+    now_ns[0] += 60_000_000
+    ids.append(generator.next_id())
+
+    assert all(len(id) == POST_ID_LENGTH and id.isalnum() for id in ids)
+    assert len(set(ids)) == len(ids)
+    assert ids == sorted(ids)
+    assert (decode_base62(ids[0]) >> 12) & 1023 == 7
+    assert post_id_time(ids[0]) == datetime.fromtimestamp(1760000000, timezone.utc)
+    assert post_id_time(ids[-1]) == datetime.fromtimestamp(1760000000.055, timezone.utc)
+
+# The server picks the id and createdAt, a client can't collide with another post's id
+def test_post_create_ignores_client_id_and_created_at():
+    post = schemas.PostCreate(id="aB3xYz", createdAt="2020-01-01T00:00:00Z", title="t", content="c")
+    assert post.id != "aB3xYz" and len(post.id) == POST_ID_LENGTH
+    assert post.createdAt == post_id_time(post.id)
+
+def test_posts_by_id_bounds_created_at_except_for_legacy_ids(db):
+    new_id = generate_post_id()
+    low, high = post_id_time_range(new_id)
+    assert high - low == timedelta(days=2)
+    assert post_id_time_range("aB3xYz") is None and post_id_time_range("aB3xYz-aB3x") is None
+
+    db.add_all([models.Post(id=new_id, title="t", content="c", owner_id=1, createdAt=post_id_time(new_id)),
+                models.Post(id="aB3xYz", title="t", content="c", owner_id=1, createdAt=datetime(2024, 5, 1))])
+    db.commit()
+    for ids in ([new_id], ["aB3xYz"], [new_id, "aB3xYz"]):
+        assert set(db.execute(select(models.Post.id).where(models.posts_by_id(*ids))).scalars()) == set(ids)
+    assert "createdAt" in str(models.posts_by_id(new_id))
+
+# Callers wait password_hash_queue_timeout for a slot, then get PasswordHashBusy (a 503 with Retry-After)
+def test_password_hash_admission(monkeypatch):
+    monkeypatch.setattr(settings, "password_hash_queue_timeout", 0.05)
+
+    async def run():
+        monkeypatch.setattr(utils, "hash_slots", asyncio.Semaphore(2))
+        for _ in range(2):
+            await utils.hash_slots.acquire()
+        started = time.monotonic()
+        with pytest.raises(utils.PasswordHashBusy):
+            await utils.run_password_hash(len, "password")
+        waited = time.monotonic() - started
+        with pytest.raises(HTTPException) as error:
+            await users.create_user(schemas.UserCreate(email="a@example.com", password="password"), None)
+
+        # A freed slot admits the next caller
+        utils.hash_slots.release()
+        return waited, error.value, await utils.run_password_hash(len, "password")
+
+    waited, error, result = asyncio.run(run())
+    assert waited >= 0.05
+    assert (error.status_code, error.headers) == (503, {"Retry-After": "1"})
+    assert result == 8
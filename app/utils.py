@@ -1,14 +1,135 @@
 from passlib.context import CryptContext
-import random
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import asyncio
+import base64
+import json
+import re
+import threading
+import time
+from .config import settings
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.password_hash_rounds)
 
-BASE62_ALPHABET = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+# bcrypt runs on its own small pool, off the event loop, and at most
+# password_hash_max_concurrency operations are admitted (running or queued) at once.
+# Callers wait up to password_hash_queue_timeout for a slot, then get PasswordHashBusy.
+hash_executor = ThreadPoolExecutor(max_workers=settings.password_hash_workers, thread_name_prefix="bcrypt")
+hash_slots = asyncio.Semaphore(settings.password_hash_max_concurrency)
 
-def generate_base62_id(length=6):
-    return ''.join(random.choices(BASE62_ALPHABET, k=length))
+class PasswordHashBusy(Exception):
+    pass
+
+# Post ids: Snowflake-style 64-bit integers, k-sortable by creation time
+#   41 bits milliseconds since POST_ID_EPOCH_MS | 10 bits worker id | 12 bits sequence
+# written as POST_ID_LENGTH base62 digits in ASCII order, so comparing ids as strings
+# (Python, Redis, posts_2.id with the "C" collation) compares their creation times.
+BASE62_ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+POST_ID_LENGTH = 11
+POST_ID_EPOCH_MS = 1735689600000  # 2025-01-01T00:00:00Z
+POST_ID_WORKER_BITS = 10
+POST_ID_SEQUENCE_BITS = 12
+POST_ID_MAX_WORKER = (1 << POST_ID_WORKER_BITS) - 1
+POST_ID_MAX_SEQUENCE = (1 << POST_ID_SEQUENCE_BITS) - 1
+
+def encode_base62(number: int, length: int = POST_ID_LENGTH):
+    digits = []
+    for _ in range(length):
+        number, digit = divmod(number, 62)
+        digits.append(BASE62_ALPHABET[digit])
+    return ''.join(reversed(digits))
+
+def decode_base62(value: str):
+    number = 0
+    for char in value:
+        number = number * 62 + BASE62_ALPHABET.index(char)
+    return number
+
+class PostIdGenerator:
+    def __init__(self, worker_id: int = 0):
+        self.worker_id = worker_id
+        self.last_ms = -1
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+    def set_worker_id(self, worker_id: int):
+        if not 0 <= worker_id <= POST_ID_MAX_WORKER:
+            raise ValueError(f"Post id worker must be between 0 and {POST_ID_MAX_WORKER}")
+        self.worker_id = worker_id
+
+    def next_id(self):
+        with self.lock:
+            # Never behind the last id: if the clock steps back, or 4096 ids were issued
+            # within one millisecond, keep counting on the last (or next) millisecond
+            now_ms = max(time.time_ns() // 1_000_000 - POST_ID_EPOCH_MS, self.last_ms)
+            if now_ms == self.last_ms:
+                self.sequence = (self.sequence + 1) & POST_ID_MAX_SEQUENCE
+                if self.sequence == 0:
+                    now_ms += 1
+            else:
+                self.sequence = 0
+            self.last_ms = now_ms
+            number = (now_ms << (POST_ID_WORKER_BITS + POST_ID_SEQUENCE_BITS)) \
+                | (self.worker_id << POST_ID_SEQUENCE_BITS) | self.sequence
+        return encode_base62(number)
+
+# One generator per process, its worker id is assigned on startup (redis_cache.claim_post_id_worker)
+post_ids = PostIdGenerator()
+
+def generate_post_id():
+    return post_ids.next_id()
+
+# Creation time encoded in a post id
+def post_id_time(post_id: str):
+    ms = decode_base62(post_id) >> (POST_ID_WORKER_BITS + POST_ID_SEQUENCE_BITS)
+    return datetime.fromtimestamp((ms + POST_ID_EPOCH_MS) / 1000, timezone.utc)
+
+POST_ID_PATTERN = re.compile(f"^[0-9A-Za-z]{{{POST_ID_LENGTH}}}$")
+# createdAt is the id's time, the slack covers posts whose createdAt came from elsewhere
+POST_ID_TIME_SLACK = timedelta(days=1)
+
+# (earliest, latest) createdAt of the post with this id, None for ids from before time-ordered ids
+def post_id_time_range(post_id: str):
+    if not POST_ID_PATTERN.match(post_id):
+        return None
+    created_at = post_id_time(post_id)
+    return created_at - POST_ID_TIME_SLACK, created_at + POST_ID_TIME_SLACK
+
+# Opaque keyset cursor over (createdAt, id)
+def encode_cursor(created_at: datetime, id: str):
+    payload = json.dumps({"c": created_at.isoformat(), "i": id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(payload["c"]), str(payload["i"])
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+# Prefix-matching tsquery from free text: "scal red" -> "scal:* & red:*"
+def build_tsquery(search: str):
+    tokens = re.findall(r"\w+", search or "")
+    return " & ".join(f"{token}:*" for token in tokens)
 
 def hash(password: str):
     return pwd_context.hash(password)
 
 def verify(plain_password: str, hashed_password: str):
     return pwd_context.verify(plain_password, hashed_password)
+
+async def run_password_hash(func, *args):
+    try:
+        await asyncio.wait_for(hash_slots.acquire(), timeout=settings.password_hash_queue_timeout)
+    except asyncio.TimeoutError:
+        raise PasswordHashBusy("Too many concurrent password operations")
+    try:
+        return await asyncio.get_running_loop().run_in_executor(hash_executor, func, *args)
+    finally:
+        hash_slots.release()
+
+async def hash_async(password: str):
+    return await run_password_hash(hash, password)
+
+async def verify_async(plain_password: str, hashed_password: str):
+    return await run_password_hash(verify, plain_password, hashed_password)
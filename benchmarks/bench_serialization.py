@@ -0,0 +1,93 @@
+# Per-request CPU of serializing a 100-post page, default path vs fast_json_responses.
+# Run from the repo root:
+#   python -m benchmarks.bench_serialization [--posts 100] [--requests 2000]
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+# Imported for its side effect only: it sets the required settings' env vars before app.config loads
+from benchmarks import standins
+
+from fastapi import FastAPI
+
+from app import schemas
+from app.config import settings
+from app.redis_cache import build_post_out
+from app.responses import page_response
+
+def make_rows(count):
+    now = datetime.now(timezone.utc)
+    return [SimpleNamespace(id=f"p{i:05d}", title=f"Post {i}", content="lorem ipsum " * 20, published=True,
+                            createdAt=now - timedelta(seconds=i), owner_id=i % 50, like_count=i)
+            for i in range(count)]
+
+# Cached docs as stored in post:* (timestamp createdAt, "1"/"0" published)
+def make_docs(rows):
+    return [{"id": row.id, "title": row.title, "content": row.content, "published": "1",
+             "createdAt": row.createdAt.timestamp(), "owner_id": row.owner_id, "likes": row.like_count}
+            for row in rows]
+
+def build_app(rows, docs):
+    app = FastAPI()
+
+    # Postgres path: PostOut built from rows
+    @app.get("/db", response_model=schemas.PostPage)
+    async def from_db():
+        return page_response([build_post_out(row, row.like_count) for row in rows])
+
+    # Redis path: cached docs returned as they are
+    @app.get("/cache", response_model=schemas.PostPage)
+    async def from_cache():
+        return page_response(docs, source="redis")
+
+    return app
+
+# One GET straight through the ASGI app, no HTTP client or server in the measurement
+async def call(app, path):
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+             "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+             "root_path": "", "headers": [], "client": ("127.0.0.1", 1), "server": ("127.0.0.1", 80)}
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    assert messages[0]["status"] == 200
+    return b"".join(message.get("body", b"") for message in messages[1:])
+
+async def measure(app, path, requests):
+    await call(app, path)
+    start_cpu, start_wall = time.process_time(), time.perf_counter()
+    for _ in range(requests):
+        body = await call(app, path)
+    cpu, wall = time.process_time() - start_cpu, time.perf_counter() - start_wall
+    return cpu / requests * 1e6, requests / wall, body
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--posts", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    rows = make_rows(args.posts)
+    app = build_app(rows, make_docs(rows))
+
+    print(f"{args.posts} posts per page, {args.requests} requests per case")
+    print(f"{'path':<8}{'mode':<10}{'cpu us/req':>12}{'req/s':>10}")
+    for path in ("/db", "/cache"):
+        results = {}
+        for fast in (False, True):
+            settings.fast_json_responses = fast
+            results[fast] = await measure(app, path, args.requests)
+            print(f"{path:<8}{'orjson' if fast else 'default':<10}{results[fast][0]:>12.0f}{results[fast][1]:>10.0f}")
+        saved = results[False][0] - results[True][0]
+        print(f"{path:<8}{'saved':<10}{saved:>12.0f}{'':>10}  ({saved / results[False][0]:.0%})")
+
+if __name__ == "__main__":
+    asyncio.run(main())
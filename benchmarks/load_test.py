@@ -0,0 +1,224 @@
+# Mixed read/write load test of server_ORM.app against the local stand-ins (benchmarks/standins.py).
+# Boots the app with its lifespan, runs the posts and likes consumers in-process, seeds users and posts,
+# then drives the workload at the given concurrency and reports latency percentiles and requests/s.
+#   pip install -r benchmarks/requirements.txt
+#   python -m benchmarks.load_test --requests 5000 --concurrency 32 --mix get_post=50,get_posts=20,create_post=15,like=15
+# --json writes the results with the commit and parameters, to compare runs across commits.
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import tempfile
+import time
+from collections import defaultdict
+
+from benchmarks import standins
+
+import httpx
+
+from app import database, server_ORM
+from app.config import settings
+from app.kafka.kafka_init import Kafka
+from app.kafka.kafka_processing import poll_posts, poll_likes
+
+ENDPOINTS = ("create_post", "get_posts", "get_post", "get_posts_batch", "feed", "like")
+DEFAULT_MIX = "get_post=50,get_posts=20,create_post=15,like=15"
+
+def parse_mix(mix: str):
+    weights = {}
+    for part in mix.split(","):
+        name, weight = part.split("=")
+        if name not in ENDPOINTS:
+            raise SystemExit(f"Unknown endpoint {name}, expected one of {', '.join(ENDPOINTS)}")
+        weights[name] = float(weight)
+    return weights
+
+# Nearest-rank percentile of a sorted list
+def percentile(values, p):
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+class Workload:
+    def __init__(self, client: httpx.AsyncClient, tokens, post_ids, seed: int):
+        self.client = client
+        self.tokens = tokens
+        self.post_ids = post_ids
+        self.liked = set()
+        self.seed = seed
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def request(self, endpoint, method, url, token, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, headers={"Authorization": f"Bearer {token}"}, **kwargs)
+            ok = response.status_code < 400
+        except Exception as e:
+            print(f"{endpoint} failed: {e}")
+            response, ok = None, False
+        self.latencies[endpoint].append(time.perf_counter() - start)
+        if not ok:
+            self.errors[endpoint] += 1
+        return response
+
+    async def create_post(self, rng, token):
+        response = await self.request("create_post", "POST", "/posts", token,
+                                      json={"title": f"Post {rng.random()}", "content": "benchmark " * rng.randint(5, 50)})
+        if response is not None and response.status_code == 201:
+            self.post_ids.append(response.json()["id"])
+
+    async def get_posts(self, rng, token):
+        await self.request("get_posts", "GET", "/posts", token, params={"limit": 20, "sortAsc": False})
+
+    async def get_post(self, rng, token):
+        await self.request("get_post", "GET", f"/posts/{rng.choice(self.post_ids)}", token)
+
+    async def get_posts_batch(self, rng, token):
+        ids = rng.sample(self.post_ids, min(20, len(self.post_ids)))
+        await self.request("get_posts_batch", "GET", "/posts/batch", token, params={"ids": ",".join(ids)})
+
+    async def feed(self, rng, token):
+        await self.request("feed", "GET", "/feed", token, params={"limit": 20})
+
+    async def like(self, rng, token):
+        # A user likes a post at most once, so every like is a real write
+        for _ in range(10):
+            post_id = rng.choice(self.post_ids)
+            if (token, post_id) not in self.liked:
+                self.liked.add((token, post_id))
+                await self.request("like", "POST", "/like/", token, json={"post_id": post_id})
+                return
+
+    async def worker(self, index, weights, remaining):
+        rng = random.Random(self.seed + index)
+        names, cumulative = list(weights), list(weights.values())
+        token = self.tokens[index % len(self.tokens)]
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            name = rng.choices(names, weights=cumulative)[0]
+            await getattr(self, name)(rng, token)
+
+async def create_users(client: httpx.AsyncClient, count: int):
+    tokens = []
+    for i in range(count):
+        email = f"bench{i}@example.com"
+        await client.post("/users/", json={"email": email, "password": "bench"})
+        response = await client.post("/login", data={"username": email, "password": "bench"})
+        response.raise_for_status()
+        tokens.append(response.json()["access_token"])
+    return tokens
+
+# Every user follows a handful of others so /feed has something to read
+async def follow_users(client: httpx.AsyncClient, tokens, per_user: int, rng):
+    for i, token in enumerate(tokens):
+        for followee in rng.sample(range(1, len(tokens) + 1), min(per_user, len(tokens))):
+            if followee != i + 1:
+                await client.post("/follow/", json={"user_id": followee}, headers={"Authorization": f"Bearer {token}"})
+
+async def seed_posts(client: httpx.AsyncClient, tokens, count: int, rng):
+    post_ids = []
+    for i in range(count):
+        response = await client.post("/posts", json={"title": f"Seed {i}", "content": "seed " * rng.randint(5, 50)},
+                                     headers={"Authorization": f"Bearer {tokens[i % len(tokens)]}"})
+        response.raise_for_status()
+        post_ids.append(response.json()["id"])
+    return post_ids
+
+# Wait for the consumers to empty the topics
+async def drain(broker, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while standins.pending_messages(broker) and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    # Let the last batch commit
+    await asyncio.sleep(settings.kafka_consumer_max_latency * 2)
+
+def report(workload: Workload, elapsed: float):
+    results = {}
+    for endpoint in ENDPOINTS:
+        latencies = sorted(workload.latencies.get(endpoint, []))
+        if not latencies:
+            continue
+        results[endpoint] = {
+            "requests": len(latencies),
+            "errors": workload.errors.get(endpoint, 0),
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "rps": len(latencies) / elapsed,
+        }
+    total = sum(result["requests"] for result in results.values())
+    results["total"] = {"requests": total, "errors": sum(result["errors"] for result in results.values()),
+                        "rps": total / elapsed}
+
+    print(f"{'endpoint':<16}{'requests':>9}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}")
+    for endpoint, result in results.items():
+        if endpoint == "total":
+            print(f"{endpoint:<16}{result['requests']:>9}{result['errors']:>8}{'':>27}{result['rps']:>9.0f}")
+        else:
+            print(f"{endpoint:<16}{result['requests']:>9}{result['errors']:>8}{result['p50_ms']:>9.2f}"
+                  f"{result['p95_ms']:>9.2f}{result['p99_ms']:>9.2f}{result['rps']:>9.0f}")
+    return results
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--follows", type=int, default=5)
+    parser.add_argument("--seed-posts", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", default=os.path.join(tempfile.gettempdir(), "smvp-benchmark.sqlite3"))
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+    weights = parse_mix(args.mix)
+
+    standins.setup_database(args.db)
+    standins.setup_redis()
+    broker, likes_consumer = standins.setup_kafka(settings.kafka_posts_topic, settings.kafka_likes_topic)
+
+    app = server_ORM.app
+    async with app.router.lifespan_context(app):
+        kafka = Kafka()
+        consumers = [
+            asyncio.create_task(poll_posts(kafka.consumer, database.SessionLocal(), kafka_producer=kafka.producer)),
+            asyncio.create_task(poll_likes(likes_consumer, database.SessionLocal(), kafka_producer=kafka.producer)),
+        ]
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            rng = random.Random(args.seed)
+            tokens = await create_users(client, args.users)
+            await follow_users(client, tokens, args.follows, rng)
+            post_ids = await seed_posts(client, tokens, args.seed_posts, rng)
+            await drain(broker)
+
+            workload = Workload(client, tokens, post_ids, args.seed)
+            remaining = [args.requests]
+            start = time.perf_counter()
+            await asyncio.gather(*[workload.worker(i, weights, remaining) for i in range(args.concurrency)])
+            elapsed = time.perf_counter() - start
+            await drain(broker)
+
+        for consumer in consumers:
+            consumer.cancel()
+
+    print(f"commit {git_commit()}, {args.requests} requests, concurrency {args.concurrency}, mix {args.mix}, "
+          f"{args.seed_posts} seed posts, {elapsed:.1f}s")
+    results = report(workload, elapsed)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"commit": git_commit(), "params": vars(args), "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    asyncio.run(main())
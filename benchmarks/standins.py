@@ -0,0 +1,236 @@
+# Local stand-ins for Postgres, Redis and Kafka so server_ORM.app runs in a single process.
+#   Postgres -> SQLite file (aiosqlite for the app, sqlite3 for the consumer), "fastapi-db" schema mapped away
+#   Redis    -> fakeredis with RedisJSON/Lua, plus a scan-based stand-in for the RediSearch "posts" index
+#   Kafka    -> in-memory topics behind the confluent_kafka Producer/Consumer calls the app makes
+# Absolute numbers are not production numbers, they're for comparing commits on the same machine.
+import json
+import os
+import queue
+import re
+import threading
+from datetime import datetime, timezone
+
+# Required settings the stand-ins make irrelevant, a real .env still wins
+for name, value in {"DATABASE_HOSTNAME": "localhost", "DATABASE_PORT": "5432", "DATABASE_NAME": "bench",
+                    "DATABASE_USERNAME": "bench", "DATABASE_PASSWORD": "bench", "SECRET_KEY": "bench",
+                    "ALGORITHM": "HS256", "ACCESS_TOKEN_EXPIRE_SECONDS": "3600", "KAFKA_PORT": "9092",
+                    "KAFKA_POSTS_TOPIC": "posts", "PASSWORD_HASH_ROUNDS": "4"}.items():
+    os.environ.setdefault(name, value)
+
+import fakeredis
+import redis.asyncio as redis
+from redis.commands.search.result import Result
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.schema import CreateColumn
+
+from app import database, migrations, models, redis_cache, server_ORM
+from app.metrics import instrument_engine
+from app.kafka import kafka_init
+
+SCHEMA_MAP = {"fastapi-db": None}
+
+# SQLite only takes expressions as column defaults in parentheses
+@compiles(CreateColumn, "sqlite")
+def compile_sqlite_column(element, compiler, **kw):
+    return compiler.visit_create_column(element, **kw)\
+        .replace("DEFAULT NOW()", "DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now'))")\
+        .replace(' COLLATE "C"', "")
+
+# Postgres functions the models use in defaults and indexes
+def register_sqlite_functions(dbapi_connection, connection_record):
+    dbapi_connection.create_function(
+        "NOW", 0, lambda: datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f"), deterministic=False)
+    dbapi_connection.create_function("to_tsvector", 2, lambda config, text: (text or "").lower(), deterministic=True)
+    dbapi_connection.execute("PRAGMA journal_mode=WAL")
+    dbapi_connection.execute("PRAGMA synchronous=NORMAL")
+
+def setup_database(path):
+    if os.path.exists(path):
+        os.remove(path)
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}", connect_args={"timeout": 30})\
+        .execution_options(schema_translate_map=SCHEMA_MAP)
+    sync_engine = create_engine(f"sqlite:///{path}", connect_args={"timeout": 30, "check_same_thread": False})\
+        .execution_options(schema_translate_map=SCHEMA_MAP)
+    event.listen(async_engine.sync_engine, "connect", register_sqlite_functions)
+    event.listen(sync_engine, "connect", register_sqlite_functions)
+
+    # Rebind the app's engines and session factories
+    instrument_engine(async_engine.sync_engine)
+    instrument_engine(sync_engine)
+
+    database.async_engine = server_ORM.async_engine = async_engine
+    database.AsyncSessionLocal.configure(bind=async_engine)
+    database.engine = sync_engine
+    database.SessionLocal.configure(bind=sync_engine)
+
+    # The migrations and partitions are Postgres-only, a plain posts_2 table stands in
+    migrations.migrate = lambda: models.Base.metadata.create_all(sync_engine)
+    migrations.ensure_post_partitions = lambda: 0
+    return async_engine, sync_engine
+
+# RediSearch stand-in for the queries search_posts issues: text match on title/content,
+# numeric range on createdAt, sort by createdAt, paging. Scans post:* on every search.
+class SearchIndexStandIn:
+    def __init__(self, client):
+        self.client = client
+
+    async def create_index(self, *args, **kwargs):
+        pass
+
+    async def search(self, query):
+        keys = [key async for key in self.client.scan_iter(match="post:*", count=1000)]
+        docs = await self.client.json().mget(keys, "$") if keys else []
+        docs = [doc[0] if isinstance(doc, list) else doc for doc in docs]
+        docs = [doc for doc in docs if doc]
+
+        terms = re.findall(r"\w+\*?", query.query_string().split(":", 1)[1]) if query.query_string() != "*" else []
+        for term in terms:
+            prefix = term.rstrip("*").lower()
+            docs = [doc for doc in docs
+                    if any(word.startswith(prefix) if term.endswith("*") else word == prefix
+                           for word in re.findall(r"\w+", f"{doc['title']} {doc['content']}".lower()))]
+        for numeric in query._filters:
+            _, field, lo, hi = numeric.args
+            # "(" marks an exclusive bound
+            lo_open, hi_open = str(lo).startswith("("), str(hi).startswith("(")
+            lo, hi = float(str(lo).lstrip("(")), float(str(hi).lstrip("("))
+            docs = [doc for doc in docs
+                    if (lo < doc[field] if lo_open else lo <= doc[field])
+                    and (doc[field] < hi if hi_open else doc[field] <= hi)]
+        if query._sortby is not None:
+            field, order = query._sortby.args
+            docs.sort(key=lambda doc: doc[field], reverse=order == "DESC")
+        page = docs[query._offset:query._offset + query._num]
+        return Result([len(docs)] + [item for doc in page for item in (f"post:{doc['id']}", ["$", json.dumps(doc)])],
+                      hascontent=True)
+
+def setup_redis():
+    server = fakeredis.FakeServer()
+    redis_cache.redis_pool = redis.ConnectionPool(connection_class=fakeredis.FakeAsyncConnection, server=server,
+                                                  decode_responses=True)
+    redis.Redis.ft = lambda self, index_name="idx": SearchIndexStandIn(self)
+    return server
+
+class MessageStandIn:
+    def __init__(self, topic, partition, offset, key, value, headers=None):
+        self._topic, self._partition, self._offset = topic, partition, offset
+        self._key, self._value, self._headers = key, value, headers
+
+    def topic(self):
+        return self._topic
+
+    def partition(self):
+        return self._partition
+
+    def offset(self):
+        return self._offset
+
+    def key(self):
+        return self._key
+
+    def value(self):
+        return self._value
+
+    def headers(self):
+        return self._headers
+
+    def error(self):
+        return None
+
+    def latency(self):
+        return 0.0
+
+def as_bytes(value):
+    return value.encode("utf-8") if isinstance(value, str) else value
+
+# One unbounded queue per topic, a single partition each
+class BrokerStandIn:
+    def __init__(self):
+        self.topics = {}
+        self.offsets = {}
+        self.lock = threading.Lock()
+
+    def topic(self, name):
+        with self.lock:
+            if name not in self.topics:
+                self.topics[name] = queue.Queue()
+                self.offsets[name] = 0
+            return self.topics[name]
+
+    def append(self, name, key, value, headers=None):
+        topic = self.topic(name)
+        with self.lock:
+            offset = self.offsets[name]
+            self.offsets[name] += 1
+        msg = MessageStandIn(name, 0, offset, as_bytes(key), as_bytes(value), headers)
+        topic.put(msg)
+        return msg
+
+class ProducerStandIn:
+    def __init__(self, broker):
+        self.broker = broker
+
+    def produce(self, topic, value=None, key=None, headers=None, on_delivery=None):
+        msg = self.broker.append(topic, key, value, headers)
+        if on_delivery:
+            on_delivery(None, msg)
+
+    def poll(self, timeout=None):
+        return 0
+
+    def flush(self, timeout=None):
+        return 0
+
+class ConsumerStandIn:
+    def __init__(self, broker, topic):
+        self.broker = broker
+        self.queue = broker.topic(topic)
+
+    def consume(self, num_messages=1, timeout=-1):
+        msgs = []
+        try:
+            msgs.append(self.queue.get(timeout=max(timeout, 0.001)))
+            while len(msgs) < num_messages:
+                msgs.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+        return msgs
+
+    def commit(self, message=None, offsets=None, asynchronous=True):
+        pass
+
+    def get_watermark_offsets(self, partition, timeout=None, cached=False):
+        return 0, self.broker.offsets.get(partition.topic, 0)
+
+    def subscribe(self, topics):
+        pass
+
+    def close(self):
+        pass
+
+# Takes the place of the Kafka singleton (Kafka() returns it)
+class KafkaStandIn:
+    def __init__(self, broker, posts_topic):
+        self.initialized = True
+        self.broker = broker
+        self.producer = ProducerStandIn(broker)
+        self.consumer = ConsumerStandIn(broker, posts_topic)
+
+    def add_topic(self, topic_name):
+        self.broker.topic(topic_name)
+
+    def start_polling(self):
+        pass
+
+    def close(self):
+        pass
+
+def setup_kafka(posts_topic, likes_topic):
+    broker = BrokerStandIn()
+    kafka_init.Kafka._instance = KafkaStandIn(broker, posts_topic)
+    return broker, ConsumerStandIn(broker, likes_topic)
+
+def pending_messages(broker):
+    return sum(topic.qsize() for topic in broker.topics.values())